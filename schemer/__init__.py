@@ -19,46 +19,12 @@
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from gi.repository import GObject, Gedit, Gtk
-import os
-
-from .schemer import GUI
-
-UI_XML = """<ui>
-<menubar name="MenuBar">
-  <menu name="ToolsMenu" action="Tools">
-    <placeholder name="ToolsOps_4">
-      <menuitem name="menuItemLaunchGui" action="LaunchGuiAction"/>
-    </placeholder>
-  </menu>
-</menubar>
-</ui>"""
-
-class WindowActivatable(GObject.Object, Gedit.WindowActivatable):
-
-  window = GObject.property(type=Gedit.Window)
-
-  def __init__(self):
-    GObject.Object.__init__(self)
-
-  def do_activate(self):
-    manager = self.window.get_ui_manager()
-    self._actions = Gtk.ActionGroup("SchemerActions")
-    self._actions.add_actions([
-      ('LaunchGuiAction', Gtk.STOCK_INFO, "Color Scheme Editor", 
-        None, "Launch color scheme editor for the current loaded scheme", 
-        self.open_dialog),
-    ])
-    manager.insert_action_group(self._actions)
-    self._ui_merge_id = manager.add_ui_from_string(UI_XML)
-    manager.ensure_update()
-
-  def open_dialog(self, action, data=None):
-    schemer.GUI(Gedit.App, os.path.dirname(__file__))
-
-  def do_deactivate(self):
-    manager = self.window.get_ui_manager()
-    manager.remove_ui(self._ui_merge_id)
-    manager.remove_action_group(self._actions)
-    manager.ensure_update()
-    
+# the command line tools (python -m schemer.samplegen for instance) import this
+# package outside of gedit, where there are no Gedit bindings to load
+try:
+  from gi.repository import Gedit
+except ImportError:
+  Gedit = None
+
+if Gedit != None:
+  from .plugin import WindowActivatable
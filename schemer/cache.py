@@ -0,0 +1,58 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+# 
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+
+# A small dict that forgets the least recently used entry once it is full
+class LRUCache:
+
+  def __init__(self, size=16):
+  
+    self.size = size
+    self.entries = collections.OrderedDict()
+    
+  def get(self, key, default=None):
+  
+    if key not in self.entries:
+      return default
+      
+    self.entries.move_to_end(key)
+    return self.entries[key]
+    
+  def __contains__(self, key):
+    return key in self.entries
+    
+  def __setitem__(self, key, value):
+  
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+    
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+      
+  def __delitem__(self, key):
+    del self.entries[key]
+    
+  def __len__(self):
+    return len(self.entries)
+    
+  def clear(self):
+    self.entries.clear()
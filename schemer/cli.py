@@ -0,0 +1,271 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Command line tool to check and normalize style schemes without gedit
+#
+#   python -m schemer.cli check PATH...
+#   python -m schemer.cli normalize [--output DIR | --in-place] PATH...
+#   python -m schemer.cli diff OLD NEW
+#   python -m schemer.cli merge [--output FILE] BASE OURS THEIRS
+#
+# For check and normalize PATH can be a scheme file or a directory of them.
+# Files are handled in parallel by a pool of processes and results are
+# printed as they finish.
+
+import io
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree as ET
+
+from .scheme import parse_scheme, write_scheme_file, save_file
+from .palette import name_colors
+from .merge import diff_schemes, merge_schemes, describe_edit, describe_value
+
+
+def find_schemes(paths):
+  """ Expand directories into the scheme files they hold. Yields (file,
+    name) where name is the path of the file relative to the directory it
+    was found in (just the file name for files given directly).
+  """
+  
+  for path in paths:
+    if os.path.isdir(path):
+      for directory, dirNames, fileNames in os.walk(path):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+          if fileName.endswith('.xml'):
+            filename = os.path.join(directory, fileName)
+            yield filename, os.path.relpath(filename, path)
+    else:
+      yield path, os.path.basename(path)
+      
+
+def process_scheme(filename, outFile=None, palette=False):
+  """ Parse, check and, if outFile is set, write a canonical copy of one
+    scheme. With palette set, colors used by several styles are written as
+    <color> definitions. Runs in a worker process.
+    
+    Returns (filename, problems, error, written) where error is set if the
+    file could not be handled at all.
+  """
+  
+  try:
+    scheme = parse_scheme(filename)
+  except (OSError, ET.ParseError) as e:
+    return (filename, [], str(e), False)
+    
+  if scheme == None:
+    return (filename, [], 'not a style scheme', False)
+    
+  if outFile == None:
+    return (filename, scheme.problems, None, False)
+    
+  output = io.StringIO()
+  write_scheme_file(output, scheme, name_colors(scheme.styles) if palette else None)
+  output = output.getvalue()
+  
+  # leave files that are already canonical alone
+  try:
+    with open(outFile, 'r', encoding='utf-8') as fp:
+      if fp.read() == output:
+        return (filename, scheme.problems, None, False)
+  except OSError:
+    pass
+    
+  directory = os.path.dirname(outFile)
+  if directory:
+    try:
+      os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+      return (filename, scheme.problems, str(e), False)
+    
+  result = save_file(outFile, lambda fp: fp.write(output), atomic=True, fsync=False)
+  
+  if not result:
+    return (filename, scheme.problems, result.error, False)
+    
+  return (filename, scheme.problems, None, True)
+  
+
+def get_out_file(filename, name, args):
+
+  if args.command != 'normalize':
+    return None
+    
+  if args.in_place:
+    return filename
+    
+  return os.path.join(args.output, name)
+  
+
+def load_schemes(filenames):
+  """ Parse the schemes given to diff or merge. Returns None, after saying
+    why, if one of them cannot be read.
+  """
+  
+  schemes = []
+  
+  for filename in filenames:
+    try:
+      scheme = parse_scheme(filename)
+    except (OSError, ET.ParseError) as e:
+      print('%s: error: %s' % (filename, e))
+      return None
+      
+    if scheme == None:
+      print('%s: error: not a style scheme' % filename)
+      return None
+      
+    schemes.append(scheme)
+    
+  return schemes
+  
+  
+def diff_command(args):
+
+  schemes = load_schemes(args.paths)
+  
+  if schemes == None:
+    return 2
+    
+  old, new = schemes
+  edits = diff_schemes(old.styles, new.styles)
+  
+  for edit in edits:
+    print(describe_edit(edit))
+    
+  return 1 if edits else 0
+  
+  
+def merge_command(args):
+
+  schemes = load_schemes(args.paths)
+  
+  if schemes == None:
+    return 2
+    
+  base, ours, theirs = schemes
+  ours.styles, conflicts = merge_schemes(base.styles, ours.styles, theirs.styles)
+  
+  for conflict in conflicts:
+    print('conflict: %s %s: base %s, ours %s, theirs %s (kept ours)' % (conflict.styleId,
+      conflict.attribute, describe_value(conflict.attribute, conflict.base),
+      describe_value(conflict.attribute, conflict.ours),
+      describe_value(conflict.attribute, conflict.theirs)), file=sys.stderr)
+      
+  if args.output:
+    result = save_file(args.output, lambda fp: write_scheme_file(fp, ours),
+      atomic=True, fsync=False)
+    if not result:
+      print('%s: error: %s' % (args.output, result.error), file=sys.stderr)
+      return 2
+  else:
+    write_scheme_file(sys.stdout, ours)
+    
+  return 1 if conflicts else 0
+  
+  
+def main(argv=None):
+
+  parser = argparse.ArgumentParser(prog='python -m schemer.cli',
+    description='Check, normalize, diff and merge gedit style schemes.')
+  parser.add_argument('command', choices=['check', 'normalize', 'diff', 'merge'])
+  parser.add_argument('paths', nargs='+', metavar='PATH',
+    help='scheme file or directory of scheme files')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+    help='number of worker processes (default: one per CPU)')
+  parser.add_argument('-o', '--output',
+    help='directory to write normalized schemes to, or file to write a merge to')
+  parser.add_argument('-i', '--in-place', action='store_true',
+    help='rewrite the schemes where they are')
+  parser.add_argument('-p', '--palette', action='store_true',
+    help='write shared colors as named <color> definitions')
+  parser.add_argument('-q', '--quiet', action='store_true', help='only print problems')
+  
+  args = parser.parse_args(argv)
+  
+  if args.command == 'normalize' and not (args.output or args.in_place):
+    parser.error('normalize needs --output or --in-place')
+    
+  if args.command == 'diff':
+    if len(args.paths) != 2:
+      parser.error('diff needs OLD and NEW schemes')
+    return diff_command(args)
+    
+  if args.command == 'merge':
+    if len(args.paths) != 3:
+      parser.error('merge needs BASE, OURS and THEIRS schemes')
+    return merge_command(args)
+    
+  files = list(find_schemes(args.paths))
+  failed = 0
+  withProblems = 0
+  
+  # two inputs must not be written to the same output file
+  outFiles = {}  # normalized output path -> input file
+  jobs = []
+  
+  for filename, name in files:
+    outFile = get_out_file(filename, name, args)
+    
+    if outFile != None:
+      key = os.path.normcase(os.path.abspath(outFile))
+      if key in outFiles:
+        failed += 1
+        print('%s: error: would overwrite the output of %s (%s)' % (filename, outFiles[key], outFile))
+        continue
+      outFiles[key] = filename
+      
+    jobs.append((filename, outFile))
+    
+  with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+    futures = dict((executor.submit(process_scheme, filename, outFile, args.palette), filename)
+      for filename, outFile in jobs)
+      
+    for future in as_completed(futures):
+      # a scheme that breaks the worker fails on its own, not the whole run
+      try:
+        filename, problems, error, written = future.result()
+      except Exception as e:
+        filename, problems, error, written = futures[future], [], str(e) or repr(e), False
+        
+      if error:
+        failed += 1
+        print('%s: error: %s' % (filename, error))
+        continue
+        
+      if problems:
+        withProblems += 1
+        for problem in problems:
+          print('%s: %s' % (filename, problem))
+      elif not args.quiet:
+        print('%s: %s' % (filename, 'written' if written else 'ok'))
+        
+      sys.stdout.flush()
+      
+  print('%d schemes, %d with problems, %d failed' % (len(files), withProblems, failed))
+  
+  return 1 if failed or (withProblems and args.command == 'check') else 0
+  
+
+if __name__ == '__main__':
+  sys.exit(main())
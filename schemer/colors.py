@@ -0,0 +1,152 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Color transforms applied to a whole scheme at once
+#
+# A transform is a function taking and returning an (r, g, b) tuple of floats
+# between 0 and 1. transform_styles runs it once per distinct packed color and
+# then swaps the results into the styles in a single pass, so the cost
+# depends on the size of the palette rather than the number of styles.
+
+import colorsys
+import collections
+
+
+def unpack_rgb(color):
+  """ Turn a packed 24-bit color into an (r, g, b) tuple of floats """
+
+  return ((color >> 16) / 255.0, ((color >> 8) & 0xff) / 255.0, (color & 0xff) / 255.0)
+
+
+def pack_rgb(rgb):
+  """ Turn an (r, g, b) tuple of floats into a packed 24-bit color """
+
+  r, g, b = (min(255, max(0, int(round(c * 255)))) for c in rgb)
+  return (r << 16) | (g << 8) | b
+
+
+def shift_hue(degrees):
+
+  def transform(rgb):
+    h, l, s = colorsys.rgb_to_hls(*rgb)
+    return colorsys.hls_to_rgb((h + degrees / 360.0) % 1.0, l, s)
+
+  return transform
+
+
+def lighten(amount):
+  """ Move the lightness of every color towards white (amount > 0) or black
+    (amount < 0) by the given fraction
+  """
+
+  def transform(rgb):
+    h, l, s = colorsys.rgb_to_hls(*rgb)
+    if amount > 0:
+      l += (1.0 - l) * amount
+    else:
+      l += l * amount
+    return colorsys.hls_to_rgb(h, l, s)
+
+  return transform
+
+
+def adjust_contrast(factor):
+  """ Scale the distance of every channel from mid grey """
+
+  def transform(rgb):
+    return tuple(0.5 + (c - 0.5) * factor for c in rgb)
+
+  return transform
+
+
+def invert_lightness():
+  """ Swap light and dark while keeping hues, to derive a dark variant of a
+    light scheme (or the other way around)
+  """
+
+  def transform(rgb):
+    h, l, s = colorsys.rgb_to_hls(*rgb)
+    return colorsys.hls_to_rgb(h, 1.0 - l, s)
+
+  return transform
+
+
+# Machado, Oliveira and Fernandes (2009), full severity, for linear RGB
+colorBlindnessMatrices = {
+  'protanopia': ((0.152286, 1.052583, -0.204868),
+                 (0.114503, 0.786281, 0.099216),
+                 (-0.003882, -0.048116, 1.051998)),
+  'deuteranopia': ((0.367322, 0.860646, -0.227968),
+                   (0.280085, 0.672501, 0.047413),
+                   (-0.011820, 0.042940, 0.968881)),
+  'tritanopia': ((1.255528, -0.076749, -0.178779),
+                 (-0.078411, 0.930809, 0.147602),
+                 (0.004733, 0.691367, 0.303900)),
+}
+
+
+def to_linear(c):
+  return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def from_linear(c):
+  c = min(1.0, max(0.0, c))
+  return c * 12.92 if c <= 0.0031308 else 1.055 * c ** (1 / 2.4) - 0.055
+
+
+def simulate_color_blindness(kind):
+  """ Show the colors as seen with protanopia, deuteranopia or tritanopia """
+
+  matrix = colorBlindnessMatrices[kind]
+
+  def transform(rgb):
+    linear = [to_linear(c) for c in rgb]
+    return tuple(from_linear(sum(m * c for m, c in zip(row, linear))) for row in matrix)
+
+  return transform
+
+
+def transform_styles(styles, transform):
+  """ Apply a color transform to every hex color in a dict of styles. Named
+    colors are left alone.
+
+    Returns the names of the styles that changed along with their packed
+    form from before, like Palette.recolor.
+  """
+
+  mapping = {}
+
+  for props in styles.values():
+    for color in (props.fg, props.bg):
+      if isinstance(color, int) and color not in mapping:
+        mapping[color] = pack_rgb(transform(unpack_rgb(color)))
+
+  changed = collections.OrderedDict()
+
+  for styleId, props in styles.items():
+    fg = mapping.get(props.fg, props.fg) if isinstance(props.fg, int) else props.fg
+    bg = mapping.get(props.bg, props.bg) if isinstance(props.bg, int) else props.bg
+
+    if fg != props.fg or bg != props.bg:
+      changed[styleId] = props.packed()
+      props.fg = fg
+      props.bg = bg
+
+  return list(changed.items())
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# WCAG contrast checks for the styles of a scheme
+
+from .resolver import StyleResolver
+
+
+# WCAG 2 level AA for normal text
+minimumRatio = 4.5
+
+# colors GtkSourceView falls back to when a scheme sets no text colors
+defaultForeground = 0x000000
+defaultBackground = 0xffffff
+
+
+def relative_luminance(color):
+  """ WCAG relative luminance of a packed 24-bit color """
+
+  luminance = 0.0
+
+  for shift, weight in ((16, 0.2126), (8, 0.7152), (0, 0.0722)):
+    c = ((color >> shift) & 0xff) / 255.0
+    c = c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+    luminance += weight * c
+
+  return luminance
+
+
+def contrast_ratio(color1, color2):
+  """ WCAG contrast ratio (1 to 21) between two packed colors """
+
+  l1 = relative_luminance(color1)
+  l2 = relative_luminance(color2)
+
+  if l1 < l2:
+    l1, l2 = l2, l1
+
+  return (l1 + 0.05) / (l2 + 0.05)
+
+
+# Effective colors and worst contrast ratio of each style
+#
+# A style is drawn with the style its map-to chain resolves to (see
+# StyleResolver), and colors that one does not set come from the text style.
+# Each style is checked against its background and the current-line and
+# selection backgrounds. Results are worked out when first asked for and
+# cached; the resolver remembers which styles a result was taken from, so an
+# edit only drops the results that depend on the edited style.
+class ContrastAudit:
+
+  backgroundStyles = ('current-line', 'selection')
+
+  def __init__(self, styles, resolver=None, minRatio=minimumRatio):
+
+    self.styles = styles
+    self.resolver = resolver if resolver != None else StyleResolver(styles)
+    self.minRatio = minRatio
+    self.colors = {}  # style id -> (foreground, background)
+    self.ratios = {}  # style id -> worst ratio, or None if it cannot be known
+
+  def get_colors(self, styleId):
+    """ Return the (foreground, background) a style is drawn with. A color
+      is None if it is not a hex color (a named color, for instance).
+    """
+
+    if styleId in self.colors:
+      return self.colors[styleId]
+
+    props = self.resolver.get_style(styleId)
+    fg = props.fg if props != None else None
+    bg = props.bg if props != None else None
+
+    if styleId != 'text' and (fg == None or bg == None):
+      self.resolver.add_dependent('text', styleId)
+      text = self.styles.get('text')
+      if text != None:
+        fg = fg if fg != None else text.fg
+        bg = bg if bg != None else text.bg
+
+    if fg == None:
+      fg = defaultForeground
+    if bg == None:
+      bg = defaultBackground
+
+    colors = (fg if isinstance(fg, int) else None, bg if isinstance(bg, int) else None)
+    self.colors[styleId] = colors
+
+    return colors
+
+  def get_ratio(self, styleId):
+    """ Return the lowest contrast ratio of a style against the backgrounds
+      it can be drawn on, or None if it cannot be worked out
+    """
+
+    if styleId in self.ratios:
+      return self.ratios[styleId]
+
+    fg, bg = self.get_colors(styleId)
+    ratio = None
+
+    if fg != None and bg != None:
+      ratio = contrast_ratio(fg, bg)
+
+      for backgroundStyle in self.backgroundStyles:
+        self.resolver.add_dependent(backgroundStyle, styleId)
+        props = self.styles.get(backgroundStyle)
+        if props != None and isinstance(props.bg, int):
+          ratio = min(ratio, contrast_ratio(fg, props.bg))
+
+    self.ratios[styleId] = ratio
+
+    return ratio
+
+  def is_low(self, styleId):
+
+    ratio = self.get_ratio(styleId)
+    return ratio != None and ratio < self.minRatio
+
+  def forget(self, styleIds):
+    """ Drop the results of styles, as returned by StyleResolver.invalidate """
+
+    for styleId in styleIds:
+      self.colors.pop(styleId, None)
+      self.ratios.pop(styleId, None)
+
+  def invalidate(self, styleId):
+    """ Forget the results that depend on a style that was edited """
+
+    self.forget(self.resolver.invalidate(styleId))
+
+  def clear(self):
+
+    self.colors.clear()
+    self.ratios.clear()
+    self.resolver.clear()
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import collections
+
+from .scheme import Props
+
+
+# One change to one style
+#
+# attribute is 'fg' or 'bg' with the raw color values, or one of the text
+# attributes ('bold', 'italic' and so on) with booleans, so toggling two of
+# them makes two edits. When a style is created or removed as a whole the
+# attribute is None and old/new are packed Props tuples, None meaning the
+# style is not in the scheme.
+Edit = collections.namedtuple('Edit', 'styleId attribute old new')
+
+flagAttributes = (('italic', Props.ITALIC), ('bold', Props.BOLD),
+  ('underline', Props.UNDERLINE), ('strikethrough', Props.STRIKETHROUGH))
+
+# only these are merged when edited in quick succession (color picking)
+mergedAttributes = ('fg', 'bg')
+
+
+def diff_styles(styleId, before, after):
+  """ Return the edits that turn the packed style before into after """
+
+  if before == after:
+    return []
+
+  if before == None or after == None:
+    return [Edit(styleId, None, before, after)]
+
+  edits = [Edit(styleId, attribute, old, new)
+    for attribute, old, new in zip(('fg', 'bg'), before[1:], after[1:]) if old != new]
+
+  for attribute, flag in flagAttributes:
+    old = bool(before[0] & flag)
+    new = bool(after[0] & flag)
+    if old != new:
+      edits.append(Edit(styleId, attribute, old, new))
+
+  return edits
+
+
+def apply_edit(styles, edit, value):
+  """ Set the value of an edit (its old or new side) in a dict of styles """
+
+  if edit.attribute == None:
+    if value == None:
+      styles.pop(edit.styleId, None)
+    else:
+      styles[edit.styleId] = Props.from_packed(value)
+    return
+
+  props = styles.get(edit.styleId)
+
+  if props == None:
+    props = styles[edit.styleId] = Props()
+
+  setattr(props, edit.attribute, value)
+
+  if props.is_clear():
+    del styles[edit.styleId]
+
+
+# Undo and redo stacks of style edits
+#
+# Only the changed attribute is kept for each edit, never a copy of the
+# scheme. Color edits to the same attribute of the same style that follow
+# each other within mergeTime seconds (picking colors) become one entry,
+# and changes made to many styles at once are kept as a tuple of edits that
+# is undone as a whole. The undo stack drops its oldest entries past
+# maxEntries.
+class EditHistory:
+
+  def __init__(self, maxEntries=500, mergeTime=1.0):
+
+    self.mergeTime = mergeTime
+    self.undoStack = collections.deque(maxlen=maxEntries)
+    self.redoStack = []
+    self.lastTime = 0
+
+  def record(self, styleId, before, after):
+    """ Record the change of a style from one packed form to another """
+
+    edits = diff_styles(styleId, before, after)
+
+    if not edits:
+      return
+
+    now = time.time()
+
+    if (len(edits) == 1 and edits[0].attribute in mergedAttributes and
+        self.undoStack and now - self.lastTime < self.mergeTime and
+        isinstance(self.undoStack[-1], Edit) and self.undoStack[-1].styleId == styleId and
+        self.undoStack[-1].attribute == edits[0].attribute):
+
+      last = self.undoStack.pop()
+
+      if last.old != edits[0].new:
+        self.undoStack.append(last._replace(new=edits[0].new))
+
+    else:
+      self.undoStack.extend(edits)
+
+    self.redoStack = []
+    self.lastTime = now
+
+  def record_group(self, changes):
+    """ Record changes to many styles as a single entry
+    
+    changes -- list of (style name, packed before, packed after)
+    """
+
+    edits = []
+
+    for styleId, before, after in changes:
+      edits += diff_styles(styleId, before, after)
+
+    if not edits:
+      return
+
+    self.undoStack.append(tuple(edits))
+    self.redoStack = []
+    self.lastTime = 0
+
+  def can_undo(self):
+    return bool(self.undoStack)
+
+  def can_redo(self):
+    return bool(self.redoStack)
+
+  def undo(self, styles):
+    """ Revert the last entry in styles and return the edits it held """
+
+    if not self.undoStack:
+      return []
+
+    entry = self.undoStack.pop()
+    edits = [entry] if isinstance(entry, Edit) else list(entry)
+
+    for edit in reversed(edits):
+      apply_edit(styles, edit, edit.old)
+
+    self.redoStack.append(entry)
+    self.lastTime = 0
+
+    return edits
+
+  def redo(self, styles):
+    """ Apply the last undone entry to styles again and return its edits """
+
+    if not self.redoStack:
+      return []
+
+    entry = self.redoStack.pop()
+    edits = [entry] if isinstance(entry, Edit) else list(entry)
+
+    for edit in edits:
+      apply_edit(styles, edit, edit.new)
+
+    self.undoStack.append(entry)
+    self.lastTime = 0
+
+    return edits
+
+  def clear(self):
+
+    self.undoStack.clear()
+    self.redoStack = []
+    self.lastTime = 0
@@ -18,260 +18,218 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import json
+import locale
+import gettext
+from xml.etree import ElementTree as ET
 
+from .cache import LRUCache
 
-# please keep these in alphabetical order so it is easy to follow
-# see available languages: /usr/share/gtksourceview-3.0/language-specs
-# or run in python >>> GtkSource.LanguageManager().get_language_ids()
-
-samples = {}
-
-samples['ada'] = """
-with Ada.Text_Io; use Ada.Text_Io;
- 
- procedure Doors is
-    type Door_State is (Closed, Open);
-    type Door_List is array(Positive range 1..100) of Door_State;
-    The_Doors : Door_List := (others => Closed);
- begin
-    for I in 1..100 loop
-       for J in The_Doors'range loop
-          if J mod I = 0 then
-             if The_Doors(J) = Closed then
-                 The_Doors(J) := Open;
-             else
-                The_Doors(J) := Closed;
-             end if;
-          end if;
-       end loop;
-    end loop;
-    for I in The_Doors'range loop
-       Put_Line(Integer'Image(I) & " is " & Door_State'Image(The_Doors(I)));
-    end loop;
- end Doors;
-"""
-
-samples['asp'] = """
-<html>
-<body>
-<form action="demo_reqquery.asp" method="get">
-Your name: <input type="text" name="fname" size="20" />
-<input type="submit" value="Submit" />
-</form>
-<%
-dim fname
-fname=Request.QueryString("fname")
-If fname<>"" Then
-      Response.Write("Hello " & fname & "!<br />")
-      Response.Write("How are you today?")
-End If
-%>
-</body>
-</html>
-"""
-
-# samples['automake'] = """
-
-samples['awk'] = """
-BEGIN {
-  for(i=1; i <= 100; i++) {
-    doors[i] = 0 # close the doors
-  }
-  for(i=1; i <= 100; i++) {
-    if ( int(sqrt(i)) == sqrt(i) ) {
-      doors[i] = 1
-    }
-  }
-  for(i=1; i <= 100; i++)
-  {
-    print i, doors[i] ? "open" : "close"
-  }
-}
-"""
-
-# samples['bennugd'] = """
-# samples['bibtex'] = """
-# samples['boo'] = """
-
-# do not remove this language since it is the fallback entry
-samples['c'] = """
-/* Some comments */
-#include <stdio.h>
- 
-int main()
-{
-  int square = 1, increment = 3, door;
-  for (door = 1; door <= 100; ++door)
-  {
-    printf("door #%d", door);
-    if (door == square)
-    {
-      printf(" is open.");
-      square += increment;
-      increment += 2;
-    }
-    else
-      printf(" is closed.");
-  }
-  return 0;
-}
-"""
-
-samples['c-sharp'] ="""
-// Creates and initializes a new integer Array
-int[] intArray = new int[5] { 1, 2, 3, 4, 5 };
-//same as
-int[] intArray = new int[]{ 1, 2, 3, 4, 5 };
-//same as
-int[] intArray = { 1, 2, 3, 4, 5 };
- 
-//Arrays are zero-based
-string[] stringArr = new string[5];
-stringArr[0] = "string";
-"""
 
-# samples['cg'] = """
-# samples['changelog'] = """
-# samples['chdr'] = """
-# samples['cmake'] = """
-# samples['cobol'] = """
-# samples['cpp'] = """
-# samples['css'] = """
-# samples['cuda'] = """
-# samples['d'] = """
-# samples['def'] = """
-# samples['desktop'] = """
-
-samples['diff'] = """
---- xinetd.d/tftp       2003-12-17 13:11:20.000000000 -0500
-+++ ./tftp      2004-01-22 11:46:14.479497688 -0500
-@@ -10,7 +10,7 @@
-        wait                    = yes
-        user                    = root
-        server                  = /usr/sbin/in.tftpd
--       server_args             = -s /tftpboot
-+       server_args             = -p -u tftpd -s /tftpboot
-        disable                 = yes
-        per_source              = 11
-        cps                     = 100 2
-"""
-# samples['docbook'] = """
-# samples['dosbatch'] = """
-# samples['dot'] = """
-# samples['dpatch'] = """
-# samples['dtd'] = """
-# samples['eiffel'] = """
-# samples['erlang'] = """
-# samples['fcl'] = """
-# samples['forth'] = """
-# samples['fortran'] = """
-# samples['fsharp'] = """
-# samples['gap'] = """
-# samples['gdb-log'] = """
-# samples['gettext-translation'] = """
-# samples['glsl'] = """
-# samples['go'] = """
-# samples['gtk-doc'] = """
-# samples['gtkrc'] = """
-# samples['haddock'] = """
-# samples['haskell'] = """
-# samples['haskell-literate'] = """
+# Holds the id, name and file of every installed language
+#
+# Filling the language list used to load every language through the
+# LanguageManager. Instead the catalog reads just the root element of each
+# .lang file and keeps the result on disk, keyed by the modification times of
+# the language-spec directories, so it is only rebuilt when languages are
+# added or removed. Names are kept untranslated and translated with the
+# gettext domain of the GtkSourceView in use when they are asked for.
+class LanguageCatalog:
+
+  version = 1
+
+  def __init__(self, searchPath, cacheFile=None, domain='gtksourceview-3.0'):
+  
+    self.searchPath = list(searchPath)
+    self.cacheFile = cacheFile
+    self.domain = domain
+    self.entries = None  # list of (id, name, filename), in search path order
+    
+  def get_key(self):
+  
+    key = []
+    
+    for directory in self.searchPath:
+      try:
+        key.append([directory, os.stat(directory).st_mtime_ns])
+      except OSError:
+        pass
+        
+    return key
+    
+  def load(self):
+    """ Return the (id, name, filename) entries, from the cache if it is
+      still valid
+    """
+    
+    if self.entries != None:
+      return self.entries
+      
+    key = self.get_key()
+    
+    if self.cacheFile:
+      try:
+        with open(self.cacheFile, 'r') as fp:
+          cache = json.load(fp)
+        if cache['version'] == self.version and cache['key'] == key:
+          self.entries = [tuple(entry) for entry in cache['languages']]
+      except (OSError, ValueError, KeyError, TypeError):
+        pass
+        
+    if self.entries == None:
+      self.entries = self.scan()
+      self.save(key)
+      
+    return self.entries
+    
+  def scan(self):
+  
+    entries = []
+    seen = set()
+    
+    # earlier directories take precedence, like in GtkSourceView
+    for directory in self.searchPath:
+      try:
+        fileNames = sorted(os.listdir(directory))
+      except OSError:
+        continue
+        
+      for fileName in fileNames:
+        if not fileName.endswith('.lang'):
+          continue
+          
+        filename = os.path.join(directory, fileName)
+        header = read_language_header(filename)
+        
+        if header and header[0] not in seen:
+          seen.add(header[0])
+          entries.append((header[0], header[1], filename))
+          
+    return entries
+    
+  def save(self, key):
+  
+    if not self.cacheFile:
+      return
+      
+    cache = {'version': self.version, 'key': key, 'languages': self.entries}
+    
+    try:
+      os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+      tempFile = self.cacheFile + '.tmp'
+      with open(tempFile, 'w') as fp:
+        json.dump(cache, fp)
+      os.replace(tempFile, self.cacheFile)
+    except OSError:
+      pass
+      
+  def get_ids(self):
+    return [entry[0] for entry in self.load()]
+    
+  def get_names(self):
+    """ Return a dict of language id -> translated name """
+    
+    return dict((entry[0], translate_name(entry[1], self.domain)) for entry in self.load())
+    
+  def get_filename(self, languageId):
+  
+    for entry in self.load():
+      if entry[0] == languageId:
+        return entry[2]
+        
+    return None
+    
 
-samples['html'] = """
-<html>
-<body>
+def read_language_header(filename):
+  """ Return (id, untranslated name) from the root element of a .lang file
+    without reading the rest of it. Translatable names are marked with a
+    leading underscore so they can be passed through translate_name later.
+  """
+  
+  try:
+    for event, element in ET.iterparse(filename, events=('start',)):
+      if element.tag.rsplit('}', 1)[-1] != 'language' or not element.get('id'):
+        return None
+      if element.get('_name'):
+        return (element.get('id'), '_' + element.get('_name'))
+      return (element.get('id'), element.get('name', element.get('id')))
+  except (OSError, ET.ParseError):
+    pass
+    
+  return None
+  
 
-<table border="1">
-  <caption>Monthly savings</caption>
-  <tr>
-    <th>Month</th>
-    <th>Savings</th>
-  </tr>
-  <tr>
-    <td>January</td>
-    <td>$100</td>
-  </tr>
-  <tr>
-    <td>February</td>
-    <td>$50</td>
-  </tr>
-</table>
+def translate_name(name, domain='gtksourceview-3.0'):
 
-</body>
-</html>
-"""
+  if name.startswith('_'):
+    # the C library knows where GtkSourceView bound its domain, Python's
+    # gettext only looks in its own default directory
+    if hasattr(locale, 'dgettext'):
+      return locale.dgettext(domain, name[1:])
+    return gettext.dgettext(domain, name[1:])
+    
+  return name
+  
 
-# samples['idl'] = """
-# samples['imagej'] = """
-# samples['ini'] = """
-# samples['java'] = """
-# samples['js'] = """
-# samples['json'] = """
-# samples['latex'] = """
-# samples['libtool'] = """
-# samples['lua'] = """
-# samples['m4'] = """
-# samples['makefile'] = """
-# samples['mallard'] = """
-# samples['markdown'] = """
-# samples['matlab'] = """
-# samples['nemerle'] = """
-# samples['nsis'] = """
-# samples['objc'] = """
-# samples['objective-caml'] = """
-# samples['objj'] = """
-# samples['ocl'] = """
-# samples['octave'] = """
-# samples['ooc'] = """
-# samples['opal'] = """
-# samples['opencl'] = """
-# samples['pascal'] = """
-# samples['perl'] = """
+# Sample texts shown in the preview, one file per language
+#
+# The samples live in the samples/ directory as <language id>.sample files.
+# The directory is listed the first time a sample is asked for, and the text
+# of a sample is only read when it is needed, with the last few kept in an
+# LRU cache, so shipping a sample for every language costs nothing at import.
+# see available languages: /usr/share/gtksourceview-3.0/language-specs
+# or run in python >>> GtkSource.LanguageManager().get_language_ids()
+class SampleRegistry:
 
-samples['php'] = """
-/* ygtyuy */
-print 'hello world';
-"""
-# samples['pkgconfig'] = """
-# samples['prolog'] = """
-# samples['proto'] = """
+  extension = '.sample'
 
-samples['python'] = """
-  def on_save_clicked(self, param):
-    if not self.currentSchemeFile:
+  def __init__(self, directory, cacheSize=8):
+  
+    self.directory = directory
+    self.files = None  # language id -> sample file
+    self.texts = LRUCache(cacheSize)
+    
+  def index(self):
+  
+    if self.files == None:
+      self.files = {}
       
-      filename = runSaveAsDialog(self.window, self.entryId.get_text() + '.xml')
+      try:
+        fileNames = os.listdir(self.directory)
+      except OSError:
+        fileNames = []
+        
+      for fileName in fileNames:
+        if fileName.endswith(self.extension):
+          self.files[fileName[:-len(self.extension)]] = os.path.join(self.directory, fileName)
+          
+    return self.files
     
-      if filename and not '.' in os.path.basename(filename):
-        filename = filename + '.xml'
+  def __contains__(self, languageId):
+    return languageId in self.index()
+    
+  def __getitem__(self, languageId):
+  
+    text = self.texts.get(languageId)
+    
+    if text == None:
+      with open(self.index()[languageId], 'r', encoding='utf-8') as fp:
+        text = fp.read()
+      self.texts[languageId] = text
       
-      if filename:
-        self.write_scheme(filename, self.entryId.get_text())
-        self.currentSchemeFile = filename
+    return text
     
-    else:
-      self.write_scheme(self.currentSchemeFile, self.entryId.get_text())
+  def get(self, languageId, default=None):
+  
+    if languageId not in self:
+      return default
       
-      # TODO handle case where there is a permissions issue
-"""
+    return self[languageId]
+    
+  def get_ids(self):
+    return sorted(self.index())
+    
 
-# samples['r'] = """
-# samples['rpmspec'] = """
-# samples['ruby'] = """
-# samples['scheme'] = """
-# samples['scilab'] = """
-# samples['sh'] = """
-# samples['sml'] = """
-# samples['sparql'] = """
-# samples['sql'] = """
-# samples['systemverilog'] = """
-# samples['t2t'] = """
-# samples['tcl'] = """
-# samples['texinfo'] = """
-# samples['vala'] = """
-# samples['vbnet'] = """
-# samples['verilog'] = """
-# samples['vhdl'] = """
-# samples['xml'] = """
-# samples['xslt'] = """
-# samples['yacc'] = """
+# do not remove the 'c' sample since it is the fallback entry
+samples = SampleRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples'))
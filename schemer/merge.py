@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Diff and three-way merge of style dicts (style name -> Props), such as
+# SchemeFile.styles or the editor's dictAllStyles. Both walk each dict once.
+
+import collections
+
+from .scheme import Props
+from .history import diff_styles, flagAttributes
+
+
+# a style that is not in a scheme compares like one with nothing set
+clearStyle = Props().packed()
+
+# One attribute that both sides changed in different ways. The merge keeps
+# ours. attribute is named as in history.Edit: 'fg', 'bg' or a text attribute
+# such as 'bold'.
+Conflict = collections.namedtuple('Conflict', 'styleId attribute base ours theirs')
+
+
+def get_packed(styles, styleId):
+
+  props = styles.get(styleId)
+  return props.packed() if props != None else None
+
+
+def style_ids(*dicts):
+  """ Every style name in the dicts, in the order they are first seen """
+
+  seen = collections.OrderedDict()
+
+  for styles in dicts:
+    for styleId in styles:
+      seen[styleId] = None
+
+  return list(seen)
+
+
+def diff_schemes(old, new):
+  """ Return the edits that turn the styles in old into those in new, with
+    one edit per changed attribute (see history.Edit)
+  """
+
+  edits = []
+
+  for styleId in style_ids(old, new):
+    edits += diff_styles(styleId, get_packed(old, styleId), get_packed(new, styleId))
+
+  return edits
+
+
+def merge_value(styleId, attribute, baseValue, oursValue, theirsValue, conflicts):
+  """ Three-way merge of one attribute, adding a Conflict if both sides
+    changed it differently
+  """
+
+  if theirsValue == baseValue or theirsValue == oursValue:
+    return oursValue
+
+  if oursValue == baseValue:
+    return theirsValue
+
+  conflicts.append(Conflict(styleId, attribute, baseValue, oursValue, theirsValue))
+
+  return oursValue
+
+
+def merge_schemes(base, ours, theirs):
+  """ Three-way merge of style dicts attribute by attribute, with the same
+    attributes diff_schemes reports (each text attribute on its own). An
+    attribute changed on only one side takes that change, one changed the
+    same way on both sides is taken as is, and one changed differently on
+    both sides keeps our value and is reported.
+
+    Returns (styles, conflicts) where styles is a new OrderedDict.
+  """
+
+  merged = collections.OrderedDict()
+  conflicts = []
+
+  for styleId in style_ids(base, ours, theirs):
+    basePacked = get_packed(base, styleId) or clearStyle
+    oursPacked = get_packed(ours, styleId) or clearStyle
+    theirsPacked = get_packed(theirs, styleId) or clearStyle
+
+    if oursPacked == theirsPacked or theirsPacked == basePacked:
+      packed = oursPacked
+    elif oursPacked == basePacked:
+      packed = theirsPacked
+    else:
+      flags = 0
+      for attribute, flag in flagAttributes:
+        if merge_value(styleId, attribute, bool(basePacked[0] & flag),
+            bool(oursPacked[0] & flag), bool(theirsPacked[0] & flag), conflicts):
+          flags |= flag
+
+      packed = (flags,) + tuple(merge_value(styleId, attribute, baseValue, oursValue,
+        theirsValue, conflicts) for attribute, baseValue, oursValue, theirsValue in
+        zip(('fg', 'bg'), basePacked[1:], oursPacked[1:], theirsPacked[1:]))
+
+    if packed != clearStyle:
+      merged[styleId] = Props.from_packed(packed)
+
+  return merged, conflicts
+
+
+def describe_edit(edit):
+  """ Return a line of text describing an edit """
+
+  if edit.attribute == None:
+    if edit.old == None:
+      return '+ %s %s' % (edit.styleId, describe_packed(edit.new))
+    if edit.new == None:
+      return '- %s %s' % (edit.styleId, describe_packed(edit.old))
+    return '~ %s %s -> %s' % (edit.styleId, describe_packed(edit.old), describe_packed(edit.new))
+
+  return '~ %s %s: %s -> %s' % (edit.styleId, edit.attribute,
+    describe_value(edit.attribute, edit.old), describe_value(edit.attribute, edit.new))
+
+
+def describe_packed(packed):
+
+  return '(%s)' % ', '.join('%s=%s' % (attribute, describe_value(attribute, value))
+    for attribute, value in zip(Props.__slots__, packed))
+
+
+def describe_value(attribute, value):
+
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+
+  if attribute == 'flags':
+    props = Props.from_packed((value, None, None))
+    return '|'.join(name for name in ('italic', 'bold', 'underline', 'strikethrough')
+      if getattr(props, name)) or 'none'
+
+  return Props.from_packed((0, value, None)).foreground or 'none'
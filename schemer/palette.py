@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+from .scheme import pack_color, unpack_color
+
+
+# The distinct colors of a style dict and the styles using each of them
+#
+# Colors are indexed by their packed form, so '#f00' and '#ff0000' are the
+# same entry. The index is built on first use and has to be rebuilt (with
+# invalidate) after the styles are edited elsewhere.
+class Palette:
+
+  def __init__(self, styles):
+
+    self.styles = styles
+    self.uses = None  # packed color -> [(style name, 'fg' or 'bg')]
+
+  def build(self):
+
+    self.uses = collections.OrderedDict()
+
+    for styleId, props in self.styles.items():
+      for attribute in ('fg', 'bg'):
+        color = getattr(props, attribute)
+        if color != None:
+          self.uses.setdefault(color, []).append((styleId, attribute))
+
+  def ensure(self):
+    if self.uses == None:
+      self.build()
+
+  def invalidate(self):
+    self.uses = None
+
+  def get_colors(self):
+    """ Return the colors as '#rrggbb' (or named color) strings, the most
+      used first
+    """
+
+    self.ensure()
+
+    return [unpack_color(color) for color in
+      sorted(self.uses, key=lambda color: -len(self.uses[color]))]
+
+  def get_uses(self, color):
+    """ Return the (style name, 'fg' or 'bg') pairs that use a color """
+
+    self.ensure()
+    return list(self.uses.get(pack_color(color), []))
+
+  def recolor(self, oldColor, newColor):
+    """ Replace a color in every style using it. Returns the names of the
+      styles that changed along with their packed form from before.
+    """
+
+    self.ensure()
+
+    old = pack_color(oldColor)
+    new = pack_color(newColor)
+
+    if old == new or old not in self.uses:
+      return []
+
+    changed = collections.OrderedDict()
+
+    for styleId, attribute in self.uses[old]:
+      props = self.styles[styleId]
+      if styleId not in changed:
+        changed[styleId] = props.packed()
+      setattr(props, attribute, new)
+
+    self.uses.setdefault(new, []).extend(self.uses.pop(old))
+
+    return list(changed.items())
+
+
+def name_colors(styles, minUses=2):
+  """ Pick names for the colors used by at least minUses styles, for the
+    <color> definitions of a scheme file. Returns an OrderedDict of
+    '#rrggbb' -> name, the most used color first.
+  """
+
+  palette = Palette(styles)
+  names = collections.OrderedDict()
+
+  for color in palette.get_colors():
+    if len(palette.get_uses(color)) < minUses:
+      break
+    if color.startswith('#'):
+      names[color] = 'palette%d' % (len(names) + 1)
+
+  return names
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+
+# Works out which style of a scheme a style id is actually drawn with
+#
+# Like GtkSourceView, a style the scheme does not define falls back along the
+# map-to chain of the language definitions (python:keyword -> def:keyword,
+# for instance) and the first style in the chain that the scheme defines is
+# used as a whole. Results are memoized. Every style along a chain records
+# the ids resolved through it, so an edit only drops the results that could
+# have changed.
+class StyleResolver:
+
+  def __init__(self, styles, get_fallback=None):
+
+    self.styles = styles
+    self.get_fallback = get_fallback  # style id -> map-to style id or None
+    self.resolved = {}  # style id -> id of the style it is drawn with, or None
+    self.dependents = collections.defaultdict(set)  # style id -> ids resolved through it
+
+  def get_chain(self, styleId):
+    """ Return the style id followed by the ids it maps to, in order """
+
+    chain = [styleId]
+
+    while self.get_fallback != None:
+      fallback = self.get_fallback(chain[-1])
+      if not fallback or fallback in chain:
+        break
+      chain.append(fallback)
+
+    return chain
+
+  def resolve(self, styleId):
+    """ Return the id of the style that styleId is drawn with, or None if
+      no style along its chain is in the scheme
+    """
+
+    if styleId in self.resolved:
+      return self.resolved[styleId]
+
+    source = None
+
+    for chainId in self.get_chain(styleId):
+      self.dependents[chainId].add(styleId)
+      if chainId in self.styles:
+        source = chainId
+        break
+
+    self.resolved[styleId] = source
+
+    return source
+
+  def get_style(self, styleId):
+    """ Return the Props a style is drawn with, or None """
+
+    source = self.resolve(styleId)
+    return self.styles[source] if source != None else None
+
+  def add_dependent(self, styleId, dependent):
+    """ Have dependent invalidated along with styleId """
+
+    self.dependents[styleId].add(dependent)
+
+  def invalidate(self, styleId):
+    """ Forget what depends on a style that was edited, added or removed.
+      Returns the ids whose results were dropped, styleId included.
+    """
+
+    affected = self.dependents.pop(styleId, set())
+    affected.add(styleId)
+
+    for dependent in affected:
+      self.resolved.pop(dependent, None)
+
+    return affected
+
+  def clear(self):
+
+    self.resolved.clear()
+    self.dependents.clear()
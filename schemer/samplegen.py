@@ -0,0 +1,528 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Generates preview samples that show as many styles of a language as possible
+#
+# The .lang file is read for the keywords and regular expressions each style
+# is attached to. From those we can tell which styles a sample text is likely
+# to show (this is an approximation: nesting of contexts is ignored) and make
+# up a short example for the styles it misses.
+#
+# To check how well a sample covers a language run:
+#   python -m schemer.samplegen /usr/share/gtksourceview-3.0/language-specs/c.lang [sample]
+
+import os
+import re
+import sys
+import collections
+from xml.etree import ElementTree as ET
+
+try:
+  from re import _parser as sre_parse
+  from re import _constants as sre_constants
+except ImportError:
+  import sre_parse
+  import sre_constants
+
+from .cache import LRUCache
+
+
+# The styles of a language and the patterns that apply them
+class LanguageSpec:
+
+  def __init__(self):
+
+    self.id = None
+    self.filename = None
+    self.styles = collections.OrderedDict()  # style id -> map-to style id or None
+    # style id -> list of (compiled regex, compiled end regex or None)
+    self.patterns = collections.OrderedDict()
+    self.examples = {}  # style id -> text that shows the style
+
+
+def local_tag(element):
+  """ Return the tag of an element without its XML namespace """
+
+  return element.tag.rsplit('}', 1)[-1]
+
+
+def parse_language(filename):
+  """ Read the styles, keywords and regexes of a .lang file. Returns a
+    LanguageSpec, or None if the file can not be read.
+  """
+
+  try:
+    root = ET.parse(filename).getroot()
+  except (OSError, ET.ParseError):
+    return None
+
+  if local_tag(root) != 'language':
+    return None
+
+  spec = LanguageSpec()
+  spec.id = root.get('id')
+  spec.filename = filename
+
+  defines = {}
+  caseSensitive = True
+
+  for element in root.iter():
+    tag = local_tag(element)
+
+    if tag == 'style' and element.get('id'):
+      spec.styles[spec.id + ':' + element.get('id')] = element.get('map-to')
+
+    elif tag == 'define-regex':
+      defines[element.get('id')] = wrap_regex(element.text or '', element)
+
+    elif tag == 'option' and element.get('name') == 'case-sensitive':
+      caseSensitive = (element.text or '').strip().lower() != 'false'
+
+  flags = 0 if caseSensitive else re.IGNORECASE
+
+  for context in root.iter():
+    if local_tag(context) != 'context':
+      continue
+
+    styleId = get_style_id(spec, context)
+
+    regexes = context_regexes(context, defines)
+
+    if styleId != None:
+      add_patterns(spec, styleId, regexes, flags)
+
+    # sub-pattern contexts style part of what their parent matches
+    for child in context:
+      if local_tag(child) == 'include':
+        for subContext in child:
+          subStyleId = get_style_id(spec, subContext)
+
+          if subStyleId != None and subContext.get('sub-pattern') != None:
+            add_patterns(spec, subStyleId, regexes, flags, extend=False)
+
+  return spec
+
+
+def get_style_id(spec, context):
+  """ Return the full style id a context applies, if it is one of ours """
+
+  styleRef = context.get('style-ref')
+
+  if not styleRef or local_tag(context) != 'context':
+    return None
+
+  if ':' in styleRef:
+    if styleRef.split(':', 1)[0] != spec.id:
+      return None
+    return styleRef
+
+  return spec.id + ':' + styleRef
+
+
+def context_regexes(context, defines):
+  """ Return (regex, example, end regex) tuples for a context. example is a
+    ready made text for keyword contexts and None otherwise. end regex is
+    only set for start/end contexts.
+  """
+
+  regexes = []
+  keywords = []
+  prefix = r'\%['
+  suffix = r'\%]'
+  start = None
+  end = None
+
+  for child in context:
+    tag = local_tag(child)
+    text = child.text or ''
+
+    if tag == 'keyword':
+      keywords.append(text)
+    elif tag == 'prefix':
+      prefix = text
+    elif tag == 'suffix':
+      suffix = text
+    elif tag == 'match':
+      regexes.append((expand_regex(wrap_regex(text, child), defines), None, None))
+    elif tag == 'start':
+      start = expand_regex(wrap_regex(text, child), defines)
+    elif tag == 'end':
+      end = expand_regex(wrap_regex(text, child), defines)
+
+  if keywords:
+    regex = expand_regex(prefix + '(?:' + '|'.join(keywords) + ')' + suffix, defines)
+    examples = [keyword for keyword in keywords if is_plain(keyword)][:1] or [None]
+    regexes.append((regex, examples[0], None))
+
+  # GtkSourceView stops these at the end of the line whatever <end> says
+  if start != None and context.get('end-at-line-end', 'false').lower() in ('true', '1'):
+    end = '$' if end == None else '(?:' + end + ')|$'
+
+  if start != None:
+    regexes.append((start, None, end))
+
+  return regexes
+
+
+def wrap_regex(text, element):
+  """ Apply the extended flag of a regex element as a scoped inline flag """
+
+  if element.get('extended', 'false').lower() == 'true':
+    return '(?x:' + text + ')'
+
+  return text
+
+
+def expand_regex(regex, defines):
+  """ Turn GtkSourceView regex extensions into plain Python regexes. Returns
+    None if the regex refers to something we can not resolve.
+  """
+
+  if regex == None:
+    return None
+
+  def replace_define(match):
+    name = match.group(1)
+    if name not in defines or defines[name] == None:
+      raise KeyError(name)
+    return '(?:' + defines[name] + ')'
+
+  try:
+    # defines can use other defines, so expand a few levels deep
+    for i in range(4):
+      if r'\%{' not in regex:
+        break
+      regex = re.sub(r'\\%\{([^}]+)\}', replace_define, regex)
+  except KeyError:
+    return None
+
+  if r'\%{' in regex:
+    return None
+
+  return regex.replace(r'\%[', r'\b').replace(r'\%]', r'\b')
+
+
+def is_plain(keyword):
+  """ Return true if a keyword regex only matches itself """
+
+  return re.escape(keyword) == keyword or re.sub(r'[\w -]', '', keyword) == ''
+
+
+def add_patterns(spec, styleId, regexes, flags, extend=True):
+  """ Add the regexes of a context to a style. With extend set, the regions
+    of start/end contexts run up to their end; sub-patterns only style what
+    the start matched.
+  """
+
+  for regex, example, endRegex in regexes:
+    if regex == None:
+      continue
+
+    try:
+      compiled = re.compile(regex, flags | re.MULTILINE)
+    except (re.error, OverflowError, RecursionError):
+      continue
+
+    endCompiled = None
+
+    if extend and endRegex != None:
+      try:
+        endCompiled = re.compile(endRegex, flags | re.MULTILINE)
+      except (re.error, OverflowError, RecursionError):
+        pass
+
+    spec.patterns.setdefault(styleId, []).append((compiled, endCompiled))
+
+    if styleId not in spec.examples:
+      if example == None:
+        example = example_for(compiled)
+        if example and endRegex != None:
+          example = example + ' text' + end_example(endRegex, flags)
+      elif not compiled.search(example):
+        example = None
+      if example:
+        spec.examples[styleId] = example
+
+
+def example_for(compiled):
+  """ Make up a short text matched by a compiled regex, or None """
+
+  try:
+    example = generate(sre_parse.parse(compiled.pattern, compiled.flags), {})
+  except (KeyError, TypeError, ValueError, IndexError, re.error, RecursionError):
+    return None
+
+  # patterns that only match an empty or whitespace text are no use to show
+  if not example.strip() or '\n' in example.strip('\n'):
+    return None
+
+  if compiled.search(example):
+    return example.strip('\n')
+
+  return None
+
+
+def end_example(regex, flags):
+  """ Return a text for the end of a start/end context, which may be nothing
+    for contexts that end at the end of the line
+  """
+
+  try:
+    return example_for(re.compile(regex, flags | re.MULTILINE)) or ''
+  except (re.error, OverflowError, RecursionError):
+    return ''
+
+
+categoryExamples = {
+  sre_constants.CATEGORY_DIGIT: '0',
+  sre_constants.CATEGORY_NOT_DIGIT: 'a',
+  sre_constants.CATEGORY_SPACE: ' ',
+  sre_constants.CATEGORY_NOT_SPACE: 'a',
+  sre_constants.CATEGORY_WORD: 'a',
+  sre_constants.CATEGORY_NOT_WORD: '-',
+}
+
+
+def generate(pattern, groups):
+  """ Build the shortest text for a parsed regex, taking the first branch of
+    every choice
+  """
+
+  output = []
+
+  for op, value in pattern:
+    name = op.name
+
+    if name == 'LITERAL':
+      output.append(chr(value))
+    elif name == 'NOT_LITERAL':
+      output.append('a' if value != ord('a') else 'b')
+    elif name == 'ANY':
+      output.append('a')
+    elif name == 'IN':
+      output.append(generate_in(value))
+    elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+      low, high, sub = value
+      output.append(generate(sub, groups) * low)
+    elif name == 'SUBPATTERN':
+      group, addFlags, delFlags, sub = value
+      text = generate(sub, groups)
+      if group != None:
+        groups[group] = text
+      output.append(text)
+    elif name == 'ATOMIC_GROUP':
+      output.append(generate(value, groups))
+    elif name == 'BRANCH':
+      texts = [generate(branch, dict(groups)) for branch in value[1]]
+      output.append(([text for text in texts if text] or [''])[0])
+    elif name == 'GROUPREF':
+      output.append(groups[value])
+    elif name == 'CATEGORY':
+      output.append(categoryExamples[value])
+    elif name in ('AT', 'ASSERT', 'ASSERT_NOT', 'GROUPREF_EXISTS'):
+      pass
+    else:
+      raise ValueError(name)
+
+  return ''.join(output)
+
+
+def generate_in(items):
+
+  if items and items[0][0].name == 'NEGATE':
+    excluded = set()
+    for op, value in items[1:]:
+      if op.name == 'LITERAL':
+        excluded.add(chr(value))
+    for candidate in 'ax0_':
+      if candidate not in excluded:
+        return candidate
+    raise ValueError('NEGATE')
+
+  op, value = items[0]
+  name = op.name
+
+  if name == 'LITERAL':
+    return chr(value)
+  elif name == 'RANGE':
+    return chr(value[0])
+  elif name == 'CATEGORY':
+    return categoryExamples[value]
+
+  raise ValueError(name)
+
+
+def find_regions(spec, text):
+  """ Return a dict of style id -> list of (start, end) offsets in text that
+    the style's patterns match. A start/end context covers everything from
+    its start up to its end, or to the end of the text if it has none.
+  """
+
+  regions = {}
+
+  for styleId, patterns in spec.patterns.items():
+    for pattern, endPattern in patterns:
+      position = 0
+
+      while position <= len(text):
+        match = pattern.search(text, position)
+
+        if match == None:
+          break
+
+        start, end = match.span()
+
+        if endPattern != None:
+          endMatch = endPattern.search(text, end)
+          end = endMatch.end() if endMatch != None else len(text)
+
+        if end > start:
+          regions.setdefault(styleId, []).append((start, end))
+
+        position = end if end > match.start() else match.start() + 1
+
+  for styleRegions in regions.values():
+    styleRegions.sort()
+
+  return regions
+
+
+def check_coverage(spec, text):
+  """ Return (styles shown, styles missed) for a sample text """
+
+  regions = find_regions(spec, text)
+
+  shown = [styleId for styleId in spec.styles if styleId in regions]
+  missed = [styleId for styleId in spec.styles if styleId not in regions]
+
+  return shown, missed
+
+
+def generate_sample(spec, baseText=None):
+  """ Return baseText (may be empty) with example lines added for every style
+    it does not show yet
+  """
+
+  text = baseText or ''
+  shown, missed = check_coverage(spec, text)
+
+  lines = [spec.examples[styleId] for styleId in missed if styleId in spec.examples]
+
+  if not lines:
+    return text
+
+  if text.strip():
+    text = text.rstrip('\n') + '\n\n'
+  else:
+    text = '\n'
+
+  return text + '\n'.join(lines) + '\n'
+
+
+# Generated samples, made when a language is first shown
+class SampleGenerator:
+
+  def __init__(self, samples, cacheSize=16):
+
+    self.samples = samples  # registry of hand written samples
+    self.cache = LRUCache(cacheSize)  # language id -> [key, spec, text, regions]
+
+  def get(self, languageId, filename):
+    """ Return (spec, sample text) for a language, or (None, None) if the
+      language file can not be read or nothing can be shown for it
+    """
+
+    try:
+      key = (filename, os.stat(filename).st_mtime_ns)
+    except (OSError, TypeError):
+      return None, None
+
+    cached = self.cache.get(languageId)
+
+    if cached != None and cached[0] == key:
+      return cached[1], cached[2]
+
+    spec = parse_language(filename)
+    text = None
+
+    if spec != None:
+      text = generate_sample(spec, self.samples.get(languageId))
+
+    if not text or not text.strip():
+      text = None
+
+    self.cache[languageId] = [key, spec, text, None]
+
+    return spec, text
+
+  def get_regions(self, languageId):
+    """ Return the style id -> [(start, end)] index of the last sample made
+      for a language. It is built the first time it is asked for and kept
+      with the sample.
+    """
+
+    cached = self.cache.get(languageId)
+
+    if cached == None or cached[1] == None or cached[2] == None:
+      return {}
+
+    if cached[3] == None:
+      cached[3] = find_regions(cached[1], cached[2])
+
+    return cached[3]
+
+
+def main(args):
+
+  if not args or args[0] in ('-h', '--help'):
+    print('usage: python -m schemer.samplegen LANGFILE [SAMPLEFILE] [--generate]')
+    return 2
+
+  generate = '--generate' in args
+  args = [arg for arg in args if arg != '--generate']
+
+  spec = parse_language(args[0])
+
+  if spec == None:
+    print('unable to read language file ' + args[0])
+    return 1
+
+  text = ''
+
+  if len(args) > 1:
+    with open(args[1], 'r', encoding='utf-8') as fp:
+      text = fp.read()
+
+  if generate:
+    text = generate_sample(spec, text)
+    print(text)
+
+  shown, missed = check_coverage(spec, text)
+
+  print('%s: %d of %d styles shown' % (spec.id, len(shown), len(spec.styles)))
+
+  for styleId in missed:
+    print('  missing ' + styleId + ('' if styleId in spec.examples else ' (no example)'))
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
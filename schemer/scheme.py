@@ -0,0 +1,634 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+# 
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The style scheme model, independent of GTK so it can also be used by the
+# command line tools
+
+import os
+import json
+import stat
+import hashlib
+import tempfile
+import time
+import collections
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+
+# Holds style properties for a GtkSourceStyle element
+#
+# The four text attributes are packed into one int of flags and colors are
+# kept as 24-bit ints, so a scheme with hundreds of styles stays small and two
+# styles can be compared by their packed form. Colors that are not hex
+# (named colors, for instance) are kept as the original string.
+class Props:
+
+  __slots__ = ('flags', 'fg', 'bg')
+
+  ITALIC = 1
+  BOLD = 2
+  UNDERLINE = 4
+  STRIKETHROUGH = 8
+
+  def __init__(self):
+  
+    self.flags = 0
+    self.fg = None  # int, str or None
+    self.bg = None  # int, str or None
+    
+  def get_flag(self, flag):
+    return bool(self.flags & flag)
+    
+  def set_flag(self, flag, value):
+    if value:
+      self.flags |= flag
+    else:
+      self.flags &= ~flag
+      
+  italic = property(lambda self: self.get_flag(Props.ITALIC),
+    lambda self, value: self.set_flag(Props.ITALIC, value))
+  bold = property(lambda self: self.get_flag(Props.BOLD),
+    lambda self, value: self.set_flag(Props.BOLD, value))
+  underline = property(lambda self: self.get_flag(Props.UNDERLINE),
+    lambda self, value: self.set_flag(Props.UNDERLINE, value))
+  strikethrough = property(lambda self: self.get_flag(Props.STRIKETHROUGH),
+    lambda self, value: self.set_flag(Props.STRIKETHROUGH, value))
+    
+  foreground = property(lambda self: unpack_color(self.fg),
+    lambda self, value: setattr(self, 'fg', pack_color(value)))
+  background = property(lambda self: unpack_color(self.bg),
+    lambda self, value: setattr(self, 'bg', pack_color(value)))
+    
+  def packed(self):
+    """ Return the (flags, foreground, background) tuple holding the style """
+    
+    return (self.flags, self.fg, self.bg)
+    
+  @classmethod
+  def from_packed(cls, packed):
+  
+    props = cls()
+    props.flags, props.fg, props.bg = packed
+    return props
+    
+  def copy(self):
+    return Props.from_packed(self.packed())
+    
+  def __eq__(self, other):
+    if not isinstance(other, Props):
+      return NotImplemented
+    return self.flags == other.flags and self.fg == other.fg and self.bg == other.bg
+    
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    return result if result is NotImplemented else not result
+    
+  def __hash__(self):
+    return hash((self.flags, self.fg, self.bg))
+    
+  def __repr__(self):
+    return 'Props(foreground=%r, background=%r, flags=%d)' % (
+      self.foreground, self.background, self.flags)
+    
+  def is_clear(self):
+    """ Return true if all the attributes are at the defaults/unset """
+    
+    return self.flags == 0 and self.fg == None and self.bg == None
+    
+  def from_gtk_source_style(self, gtkStyle):
+  
+    self.background = gtkStyle.props.background
+    self.foreground = gtkStyle.props.foreground
+    self.italic = gtkStyle.props.italic
+    self.bold = gtkStyle.props.bold
+    self.underline = gtkStyle.props.underline
+    self.strikethrough = gtkStyle.props.strikethrough
+    
+    # here we make sure every color starts with a hash
+    # maybe this is a workaround for a bug that I should file
+    # or maybe this is a false assumption
+
+    # if self.foreground and self.foreground[0] != '#':
+    #   self.foreground = '#' + self.foreground
+      
+    # if self.background and self.background[0] != '#':
+    #   self.background = '#' + self.background
+    
+
+def pack_color(color):
+  """ Turn a '#rgb', '#rrggbb' or '#rrrrggggbbbb' color into a 24-bit int.
+    Anything else is returned untouched.
+  """
+  
+  if not color or color[0] != '#':
+    return color or None
+    
+  digits = color[1:]
+  
+  try:
+    if len(digits) == 3:
+      return int(''.join(c + c for c in digits), 16)
+    elif len(digits) == 6:
+      return int(digits, 16)
+    elif len(digits) == 12:
+      return int(digits[0:2] + digits[4:6] + digits[8:10], 16)
+  except ValueError:
+    pass
+    
+  return color
+  
+  
+def unpack_color(color):
+  """ Turn a packed color back into the '#rrggbb' form used in scheme files """
+  
+  if isinstance(color, int):
+    return '#%06x' % color
+    
+  return color
+
+
+def write_scheme_xml(fp, schemeId, schemeName, author, description, styles, palette=None):
+  """ Write a style scheme document to a file-like object, one element at a
+    time. Attributes are always written in the same order and every value is
+    escaped.
+    
+    fp -- anything with a write() method
+    styles -- mapping of style name -> Props
+    palette -- optional mapping of '#rrggbb' color -> name. The colors are
+      written as <color> elements and styles refer to them by name.
+  """
+  
+  write = fp.write
+  
+  write('<style-scheme name=' + quote_attr(schemeName) +
+    ' id=' + quote_attr(schemeId) + ' version="1.0">\n')
+  
+  write('  <author>' + escape(author) + '</author>\n')
+  write('  <description>' + escape(description) + '</description>\n\n')
+  
+  if palette:
+    for color, name in palette.items():
+      write('  <color name=' + quote_attr(name) + '\tvalue=' + quote_attr(color) + '/>\n')
+    write('\n')
+  else:
+    palette = {}
+  
+  for k, v in styles.items():
+    line = ['  <style name=', quote_attr(k), '\t']
+    
+    if (v.foreground):
+      line += ['foreground=', quote_attr(palette.get(v.foreground, v.foreground)), ' ']
+    if (v.background):
+      line += ['background=', quote_attr(palette.get(v.background, v.background)), ' ']
+    if (v.italic): line.append('italic="true" ')
+    if (v.bold): line.append('bold="true" ')
+    if (v.underline):  line.append('underline="true" ')
+    if (v.strikethrough):  line.append('strikethrough="true" ')
+    
+    line.append('/>\n')
+    write(''.join(line))
+  
+  write('</style-scheme>\n')
+  
+  
+def quote_attr(value):
+  """ Escape and double quote an attribute value """
+  
+  return '"' + escape(value, {'"': '&quot;'}) + '"'
+  
+  
+class SaveResult(collections.namedtuple('SaveResult', 'ok location error elapsed')):
+  """ Outcome of a save. Evaluates as false when the save failed, in which
+    case error holds the reason. elapsed is in seconds.
+  """
+  
+  __slots__ = ()
+  
+  def __bool__(self):
+    return self.ok
+    
+    
+def get_umask():
+  """ Return the file mode creation mask of the process """
+  
+  # it can only be read by setting it
+  mask = os.umask(0o022)
+  os.umask(mask)
+  
+  return mask
+  
+  
+def save_file(location, write, atomic=True, fsync=True):
+  """ Save a file by handing an open text file to write(fp).
+  
+    With atomic set, the data goes to a temp file next to location which then
+    replaces it with os.replace, so readers only ever see the old or the new
+    file. fsync additionally flushes the file (and its directory) to disk.
+    Otherwise location is truncated and written in place. A symlink is
+    followed, so the file it points to is replaced and the link kept.
+    Anything raised while saving, by write as well, is returned as the error.
+  """
+  
+  start = time.time()
+  
+  if not atomic:
+    try:
+      with open(location, 'w', encoding='utf-8') as fp:
+        write(fp)
+    except Exception as e:
+      return SaveResult(False, location, str(e), time.time() - start)
+      
+    return SaveResult(True, location, None, time.time() - start)
+    
+  target = os.path.realpath(location)
+  directory = os.path.dirname(target)
+  tempPath = None
+  
+  try:
+    fd, tempPath = tempfile.mkstemp(prefix='.' + os.path.basename(target) + '.',
+      suffix='.tmp', dir=directory)
+      
+    with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+      write(fp)
+      fp.flush()
+      if fsync:
+        os.fsync(fp.fileno())
+        
+    # keep the permissions of the file being replaced, mkstemp makes it 0600
+    if os.path.exists(target):
+      os.chmod(tempPath, stat.S_IMODE(os.stat(target).st_mode))
+    else:
+      os.chmod(tempPath, 0o666 & ~get_umask())
+      
+    os.replace(tempPath, target)
+    tempPath = None
+    
+    if fsync:
+      dirFd = os.open(directory, os.O_RDONLY)
+      try:
+        os.fsync(dirFd)
+      finally:
+        os.close(dirFd)
+        
+  except Exception as e:
+    return SaveResult(False, location, str(e), time.time() - start)
+    
+  finally:
+    if tempPath:
+      try:
+        os.remove(tempPath)
+      except OSError:
+        pass
+        
+  return SaveResult(True, location, None, time.time() - start)
+  
+  
+# Holds everything read from a style scheme file
+class SchemeFile:
+
+  def __init__(self):
+  
+    self.filename = None
+    self.id = None
+    self.name = None
+    self.description = ''
+    self.authors = []
+    self.colors = collections.OrderedDict()  # palette: name -> color value
+    self.styles = collections.OrderedDict()  # style name -> Props
+    self.problems = []  # things found wrong with the file, as text
+    
+
+# attributes of a <style> element that Props keeps
+styleAttributes = ('name', 'foreground', 'background', 'italic', 'bold',
+  'underline', 'strikethrough', 'use-style')
+
+boolValues = ('true', 'false', '1', '0')
+underlineValues = boolValues + ('single', 'double', 'low', 'error', 'none')
+
+
+def parse_bool(value):
+  """ Read a boolean attribute the way GtkSourceView does """
+  
+  return value.lower() in ('true', '1', 'single', 'double', 'low', 'error')
+  
+  
+def is_color(value, palette):
+  """ Return true if value is a hex color, a palette name or looks like a
+    named color
+  """
+  
+  return (value in palette or isinstance(pack_color(value), int) or
+    (value[0] != '#' and value.replace(' ', '').isalnum()))
+  
+
+def parse_scheme(filename):
+  """ Parse a style scheme file in a single pass and build the style model
+    straight from the XML attributes. Palette colors and use-style references
+    are resolved once the whole file has been read.
+    
+    Returns a SchemeFile, or None if the file is not a style scheme.
+  """
+  
+  scheme = SchemeFile()
+  scheme.filename = filename
+  
+  useStyles = []  # (style name, referenced style name)
+  
+  events = ET.iterparse(filename, events=('start', 'end'))
+  
+  for event, element in events:
+  
+    if event == 'start':
+      if scheme.id == None:
+        if element.tag != 'style-scheme':
+          return None
+        scheme.id = element.get('id')
+        scheme.name = element.get('name', element.get('_name'))
+        if element.get('parent-scheme'):
+          scheme.problems.append('parent-scheme "%s" is not supported and will be dropped' %
+            element.get('parent-scheme'))
+      continue
+      
+    tag = element.tag
+    
+    if tag == 'style':
+      styleName = element.get('name')
+      styleProps = Props()
+      
+      check_style(scheme, element)
+      
+      # reported by check_style, there is nothing to keep it under
+      if not styleName:
+        element.clear()
+        continue
+        
+      if element.get('use-style'):
+        useStyles.append((styleName, element.get('use-style')))
+      else:
+        styleProps.foreground = element.get('foreground')
+        styleProps.background = element.get('background')
+        styleProps.italic = parse_bool(element.get('italic', 'false'))
+        styleProps.bold = parse_bool(element.get('bold', 'false'))
+        styleProps.underline = parse_bool(element.get('underline', 'false'))
+        styleProps.strikethrough = parse_bool(element.get('strikethrough', 'false'))
+        
+      scheme.styles[styleName] = styleProps
+      
+    elif tag == 'color':
+      scheme.colors[element.get('name')] = element.get('value')
+      
+    elif tag == 'author':
+      scheme.authors.append((element.text or '').strip())
+      
+    elif tag in ('description', '_description'):
+      scheme.description = (element.text or '').strip()
+      
+    # style elements have no children, so nothing more is needed from them
+    element.clear()
+    
+  if scheme.id == None:
+    return None
+    
+  if not scheme.id:
+    scheme.problems.append('the scheme has no id')
+    
+  if not scheme.name:
+    scheme.problems.append('the scheme has no name')
+    
+  for styleProps in scheme.styles.values():
+    for color in (styleProps.foreground, styleProps.background):
+      if color and not is_color(color, scheme.colors):
+        scheme.problems.append('unknown color "%s"' % color)
+        
+  # swap palette names for the colors they stand for
+  if scheme.colors:
+    for styleProps in scheme.styles.values():
+      if styleProps.foreground in scheme.colors:
+        styleProps.foreground = scheme.colors[styleProps.foreground]
+      if styleProps.background in scheme.colors:
+        styleProps.background = scheme.colors[styleProps.background]
+        
+  # styles that just point at another style get a copy of its attributes
+  references = collections.OrderedDict(useStyles)
+  resolved = {}  # style name -> Props it ends up with, or None if it cannot
+  
+  for styleName in references:
+    resolve_use_style(scheme, references, resolved, styleName)
+    
+  return scheme
+  
+  
+def resolve_use_style(scheme, references, resolved, styleName):
+  """ Follow a chain of use-style references to a style with attributes of
+    its own and give every style along it a copy of those. Cycles and
+    missing styles are recorded in scheme.problems; the styles involved
+    are left empty.
+  """
+  
+  chain = []
+  name = styleName
+  
+  while name in references and name not in resolved:
+    if name in chain:
+      cycle = chain[chain.index(name):] + [name]
+      scheme.problems.append('use-style references form a cycle: %s' %
+        ' -> '.join('"%s"' % link for link in cycle))
+      props = None
+      break
+    chain.append(name)
+    name = references[name]
+  else:
+    if name in resolved:
+      props = resolved[name]
+    elif name in scheme.styles:
+      props = scheme.styles[name]
+    else:
+      scheme.problems.append('style "%s" uses missing style "%s"' % (chain[-1], name))
+      props = None
+      
+  for link in chain:
+    resolved[link] = props
+    if props != None:
+      scheme.styles[link] = props.copy()
+  
+  
+def check_style(scheme, element):
+  """ Record what is wrong with a <style> element in scheme.problems """
+  
+  styleName = element.get('name')
+  
+  if not styleName:
+    scheme.problems.append('a style has no name')
+    return
+    
+  if styleName in scheme.styles:
+    scheme.problems.append('style "%s" is defined more than once' % styleName)
+    
+  for attribute in element.keys():
+    if attribute not in styleAttributes:
+      scheme.problems.append('style "%s": attribute "%s" is not supported and will be dropped' %
+        (styleName, attribute))
+        
+  for attribute in ('italic', 'bold', 'strikethrough'):
+    if element.get(attribute, 'false').lower() not in boolValues:
+      scheme.problems.append('style "%s": "%s" is not a valid value for %s' %
+        (styleName, element.get(attribute), attribute))
+        
+  if element.get('underline', 'false').lower() not in underlineValues:
+    scheme.problems.append('style "%s": "%s" is not a valid value for underline' %
+      (styleName, element.get('underline')))
+      
+      
+def write_scheme_file(fp, scheme, palette=None):
+  """ Write a parsed scheme back out in the canonical form the editor saves """
+  
+  write_scheme_xml(fp, scheme.id or '', scheme.name or '', ', '.join(scheme.authors),
+    scheme.description, scheme.styles, palette)
+      
+      
+# Parsed schemes kept on disk between sessions
+#
+# Each scheme has its own small JSON file in the cache directory, named after
+# a hash of the scheme's path and holding the modification time and size it
+# was parsed at. An unchanged scheme is loaded with one stat and one small
+# read and no XML parsing, and parsing a changed one only rewrites its own
+# entry. Past maxEntries the entries written longest ago are removed.
+class SchemeCache:
+
+  version = 2  # bumped when parse_scheme changes what it returns
+
+  def __init__(self, directory, maxEntries=64):
+  
+    self.directory = directory
+    self.maxEntries = maxEntries
+    
+  def get_entry_file(self, filename):
+  
+    digest = hashlib.sha1(os.path.abspath(filename).encode('utf-8', 'surrogateescape'))
+    return os.path.join(self.directory, digest.hexdigest() + '.json')
+    
+  def load(self, entryFile, filename, key):
+    """ Return the cached SchemeFile if the entry matches, or None """
+    
+    try:
+      with open(entryFile, 'r') as fp:
+        entry = json.load(fp)
+      if (entry['version'] == self.version and entry['path'] == filename and
+          entry['key'] == key):
+        return scheme_from_dict(entry['scheme'], filename)
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+      
+    return None
+    
+  def save(self, entryFile, filename, key, scheme):
+  
+    entry = {'version': self.version, 'path': filename, 'key': key,
+      'scheme': scheme_to_dict(scheme)}
+    
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+    except OSError:
+      return
+      
+    if save_file(entryFile, lambda fp: json.dump(entry, fp), atomic=True, fsync=False):
+      self.prune()
+      
+  def prune(self):
+    """ Remove the oldest entries past maxEntries """
+    
+    entries = []
+    
+    try:
+      fileNames = os.listdir(self.directory)
+    except OSError:
+      return
+      
+    for fileName in fileNames:
+      if fileName.endswith('.json'):
+        path = os.path.join(self.directory, fileName)
+        try:
+          entries.append((os.stat(path).st_mtime_ns, path))
+        except OSError:
+          pass
+          
+    entries.sort()
+    
+    for mtime, path in entries[:max(0, len(entries) - self.maxEntries)]:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+        
+  def parse(self, filename):
+    """ Return the SchemeFile for a scheme, from the cache if the file has
+      not changed since, or None like parse_scheme. Parse errors are raised
+      as by parse_scheme.
+    """
+    
+    try:
+      st = os.stat(filename)
+    except OSError:
+      return parse_scheme(filename)
+      
+    key = [st.st_mtime_ns, st.st_size]
+    entryFile = self.get_entry_file(filename)
+    
+    scheme = self.load(entryFile, filename, key)
+    
+    if scheme != None:
+      return scheme
+      
+    scheme = parse_scheme(filename)
+    
+    if scheme != None:
+      self.save(entryFile, filename, key, scheme)
+      
+    return scheme
+    
+    
+def scheme_to_dict(scheme):
+  """ Return a SchemeFile as plain data that can be stored as JSON """
+  
+  return {
+    'id': scheme.id,
+    'name': scheme.name,
+    'description': scheme.description,
+    'authors': scheme.authors,
+    'colors': list(scheme.colors.items()),
+    'styles': [[name] + list(props.packed()) for name, props in scheme.styles.items()],
+    'problems': scheme.problems,
+  }
+  
+  
+def scheme_from_dict(data, filename):
+
+  scheme = SchemeFile()
+  scheme.filename = filename
+  scheme.id = data['id']
+  scheme.name = data['name']
+  scheme.description = data['description']
+  scheme.authors = list(data['authors'])
+  scheme.colors = collections.OrderedDict((name, value) for name, value in data['colors'])
+  scheme.styles = collections.OrderedDict((name, Props.from_packed((flags, fg, bg)))
+    for name, flags, fg, bg in data['styles'])
+  scheme.problems = list(data['problems'])
+  
+  return scheme
@@ -18,58 +18,489 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os
 import sys
 import collections
+import shutil
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
 
-from gi.repository import Gtk, GdkPixbuf, Gdk, GtkSource, Gio, GLib
+from gi.repository import Gtk, GdkPixbuf, Gdk, GtkSource, Gio, GLib, Gedit
 
-from .languages import samples
+from .cache import LRUCache
+from .history import EditHistory
+from .palette import Palette, name_colors
+from .merge import merge_schemes, style_ids, describe_value
+from . import colors
+from .contrast import ContrastAudit
+from .resolver import StyleResolver
+from .thumbnails import get_thumbnail_file, make_thumbnail
+from .scheme import Props, SchemeCache, write_scheme_xml, save_file
+from .languages import samples, LanguageCatalog
+from .samplegen import SampleGenerator
 
 
-# Holds style properties for a GtkSourceStyle element
-class Props:
+def debug(message):
+  """ Print timing and diagnostic messages when SCHEMER_DEBUG is set """
+  
+  if os.environ.get('SCHEMER_DEBUG'):
+    print('schemer: ' + message)
+    
+    
+def fill_model(widget, store, values):
+  """ Append a single column of values to a ListStore in one pass. If the
+    store is shown by widget (a TreeView or ComboBox) it is detached while it
+    is filled, so the widget does not relayout for every inserted row.
+  """
+  
+  if widget != None:
+    widget.set_model(None)
+    
+  append = store.insert_with_valuesv
+  for value in values:
+    append(-1, [0], [value])
+    
+  if widget != None:
+    widget.set_model(store)
+    
+    
+class SchemeIndex:
+  """ Lookup tables of scheme id -> name and name -> id for a scheme manager.
+    They are built the first time they are needed and thrown away whenever
+    the manager is rescanned or its search path changes.
+  """
+
+  def __init__(self, manager):
+  
+    self.manager = manager
+    self.idToName = None
+    self.nameToId = None
+    
+  def build(self):
+  
+    self.idToName = {}
+    self.nameToId = {}
+    
+    for schemeId in self.manager.get_scheme_ids():
+      name = self.manager.get_scheme(schemeId).get_name()
+      self.idToName[schemeId] = name
+      self.nameToId[name] = schemeId
+      
+  def ensure(self):
+    if self.idToName == None:
+      self.build()
+      
+  def invalidate(self):
+  
+    self.idToName = None
+    self.nameToId = None
+    
+  def force_rescan(self):
+  
+    self.manager.force_rescan()
+    self.invalidate()
+    
+  def get_name(self, schemeId):
+    self.ensure()
+    return self.idToName.get(schemeId)
+    
+  def get_id(self, schemeName):
+    self.ensure()
+    return self.nameToId.get(schemeName)
+    
+  def conflicts(self, schemeId, schemeName):
+    """ Return true if an installed scheme already uses the ID or the name """
+    
+    self.ensure()
+    return schemeId in self.idToName or schemeName in self.nameToId
+    
+
+class SchemePropagator:
+  """ Applies a style scheme to every open document. Documents shown in a
+    view are updated right away, the others in small batches from idle
+    callbacks so gedit stays responsive with many buffers open.
+  """
+
+  def __init__(self, scheme, batchSize=10):
+  
+    self.scheme = scheme
+    self.batchSize = batchSize
+    self.pending = []
+    self.touched = 0
+    self.startTime = None
+    self.elapsed = None  # seconds, set once every document is done
+    
+  def start(self, app):
+  
+    self.startTime = time.time()
+    
+    visible = set()
+    
+    for window in app.get_windows():
+      # the application also holds dialogs and other plain Gtk windows
+      if not isinstance(window, Gedit.Window):
+        continue
+        
+      for view in window.get_views():
+        if view.get_mapped():
+          visible.add(view.get_buffer())
+          
+    for doc in visible:
+      self.apply(doc)
+      
+    self.pending = [doc for doc in app.get_documents() if doc not in visible]
+    
+    if self.pending:
+      GLib.idle_add(self.on_idle)
+    else:
+      self.finish()
+      
+  def apply(self, doc):
+  
+    doc.set_style_scheme(self.scheme)
+    self.touched += 1
+    
+  def on_idle(self):
+  
+    batch = self.pending[:self.batchSize]
+    del self.pending[:self.batchSize]
+    
+    for doc in batch:
+      self.apply(doc)
+      
+    if self.pending:
+      return True
+      
+    self.finish()
+    return False
+    
+  def finish(self):
+  
+    self.elapsed = time.time() - self.startTime
+    debug('applied scheme to %d documents in %.1f ms' % (self.touched, self.elapsed * 1000))
+    
+
+class PreviewScheduler:
+  """ Coalesces bursts of preview requests (color drags, quick toggles) into
+    a single render once the main loop gets back to us. With debounce set,
+    every request restarts the wait, so the render only happens once the
+    requests have stopped for the whole interval.
+  """
 
-  def __init__(self):
+  def __init__(self, render, interval=16, debounce=False):
   
-    self.background = None  # str
-    self.foreground = None  # str
-    self.italic = False
-    self.bold = False
-    self.strikethrough = False
-    self.underline = False
+    self.render = render
+    self.interval = interval  # milliseconds to wait for more requests, 0 for idle
+    self.debounce = debounce
+    self.sourceId = None
+    self.renders = 0
+    self.coalesced = 0  # requests that were folded into an already pending render
+    
+  def schedule(self):
+    """ Request a render. Does nothing but count if one is already pending,
+      unless debouncing, where the pending one is pushed back.
+    """
+    
+    if self.sourceId != None:
+      self.coalesced += 1
+      if not self.debounce:
+        return
+      GLib.source_remove(self.sourceId)
+      self.sourceId = None
+      
+    if self.interval > 0:
+      self.sourceId = GLib.timeout_add(self.interval, self.on_timeout)
+    else:
+      self.sourceId = GLib.idle_add(self.on_timeout)
+      
+  def set_interval(self, interval):
+  
+    self.interval = max(0, int(interval))
+    
+  def flush(self):
+    """ Render right away if a render is pending """
+    
+    if self.sourceId != None:
+      GLib.source_remove(self.sourceId)
+      self.on_timeout()
+      
+  def cancel(self):
+  
+    if self.sourceId != None:
+      GLib.source_remove(self.sourceId)
+      self.sourceId = None
+      
+  def on_timeout(self):
+  
+    self.sourceId = None
+    self.renders += 1
+    self.render()
+    
+    return False
+    
+
+# whole-scheme color transforms offered by the palette window
+colorTransforms = [
+  ('Shift hue by 30\u00b0', colors.shift_hue(30)),
+  ('Shift hue by -30\u00b0', colors.shift_hue(-30)),
+  ('Lighten', colors.lighten(0.1)),
+  ('Darken', colors.lighten(-0.1)),
+  ('Increase contrast', colors.adjust_contrast(1.2)),
+  ('Decrease contrast', colors.adjust_contrast(0.8)),
+  ('Invert lightness (dark/light variant)', colors.invert_lightness()),
+  ('Simulate protanopia', colors.simulate_color_blindness('protanopia')),
+  ('Simulate deuteranopia', colors.simulate_color_blindness('deuteranopia')),
+  ('Simulate tritanopia', colors.simulate_color_blindness('tritanopia')),
+]
+
+
+class PaletteWindow:
+  """ Lists the distinct colors of the scheme with the number of styles
+    using each. Picking a new color for an entry replaces it in all of them.
+  """
+
+  def __init__(self, gui):
+  
+    self.gui = gui
+    
+    self.window = Gtk.Window(title='Scheme palette', transient_for=gui.window,
+      destroy_with_parent=True, border_width=6)
+    self.window.set_default_size(300, 360)
+    self.window.connect('delete-event', lambda *args: self.window.hide() or True)
+    
+    self.store = Gtk.ListStore(str, int, str)  # color, number of uses, style names
+    
+    self.treeview = Gtk.TreeView(model=self.store, tooltip_column=2)
+    
+    swatch = Gtk.CellRendererText(text='      ')
+    column = Gtk.TreeViewColumn('Color', swatch, background=0)
+    column.pack_start(Gtk.CellRendererText(), True)
+    column.add_attribute(column.get_cells()[1], 'text', 0)
+    self.treeview.append_column(column)
+    self.treeview.append_column(Gtk.TreeViewColumn('Styles', Gtk.CellRendererText(), text=1))
+    
+    self.selection = self.treeview.get_selection()
+    self.selection.connect('changed', self.on_color_selected)
+    
+    scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+    scrolled.set_shadow_type(Gtk.ShadowType.IN)
+    scrolled.add(self.treeview)
+    
+    self.colorbuttonReplace = Gtk.ColorButton(sensitive=False)
+    self.colorbuttonReplace.connect('color-set', self.on_replace_color_set)
+    
+    self.checkbuttonSave = Gtk.CheckButton(label='Save shared colors as named colors')
+    self.checkbuttonSave.set_active(gui.savePalette)
+    self.checkbuttonSave.connect('toggled', self.on_save_toggled)
+    
+    self.comboTransform = Gtk.ComboBoxText()
+    for label, transform in colorTransforms:
+      self.comboTransform.append_text(label)
+    self.comboTransform.set_active(0)
+    
+    buttonTransform = Gtk.Button(label='Apply to all')
+    buttonTransform.connect('clicked', self.on_transform_clicked)
+    
+    transformBox = Gtk.Box(spacing=6)
+    transformBox.pack_start(self.comboTransform, True, True, 0)
+    transformBox.pack_start(buttonTransform, False, False, 0)
+    
+    replaceBox = Gtk.Box(spacing=6)
+    replaceBox.pack_start(Gtk.Label(label='Replace with'), False, False, 0)
+    replaceBox.pack_start(self.colorbuttonReplace, False, False, 0)
+    
+    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+    box.pack_start(scrolled, True, True, 0)
+    box.pack_start(replaceBox, False, False, 0)
+    box.pack_start(transformBox, False, False, 0)
+    box.pack_start(self.checkbuttonSave, False, False, 0)
+    self.window.add(box)
+    
+  def show(self):
+  
+    self.window.show_all()
+    self.window.present()
+    self.refresh()
+    
+  def refresh(self):
+    """ Rebuild the list from the current styles, keeping the selection """
+    
+    if not self.window.get_visible():
+      return
+      
+    model, treeIter = self.selection.get_selected()
+    selected = model[treeIter][0] if treeIter != None else None
+    
+    palette = Palette(self.gui.dictAllStyles)
+    rows = []
+    
+    for color in palette.get_colors():
+      uses = palette.get_uses(color)
+      rows.append((color, len(uses), '\n'.join(sorted(set(styleId for styleId, attribute in uses)))))
+      
+    self.treeview.set_model(None)
+    self.store.clear()
+    for row in rows:
+      self.store.insert_with_valuesv(-1, [0, 1, 2], row)
+    self.treeview.set_model(self.store)
+    
+    for row in self.store:
+      if row[0] == selected:
+        self.selection.select_iter(row.iter)
+        
+  def on_color_selected(self, selection):
+  
+    model, treeIter = selection.get_selected()
+    
+    self.colorbuttonReplace.set_sensitive(treeIter != None)
+    
+    if treeIter != None:
+      color = Gdk.color_parse(model[treeIter][0])
+      if color != None:
+        self.colorbuttonReplace.set_color(color)
+        
+  def on_replace_color_set(self, button):
+  
+    model, treeIter = self.selection.get_selected()
+    
+    if treeIter == None:
+      return
+      
+    color = button.get_color()
+    cScale = 255.0/65535.0
+    newColor = ('#%02x%02x%02x' %
+      (int(round(color.red * cScale)), int(round(color.green * cScale)), int(round(color.blue * cScale))))
+    oldColor = model[treeIter][0]
     
-  def is_clear(self):
-    """ Return true if all the attributes are at the defaults/unset """
+    self.gui.recolor(oldColor, newColor)
     
-    return (self.foreground == None and 
-        self.background == None and 
-        self.bold == False and 
-        self.italic == False and 
-        self.underline == False and 
-        self.strikethrough == False)
+    self.selection.unselect_all()
+    self.refresh()
     
-  def from_gtk_source_style(self, gtkStyle):
+    for row in self.store:
+      if row[0] == newColor:
+        self.selection.select_iter(row.iter)
+        
+  def on_transform_clicked(self, button):
   
-    self.background = gtkStyle.props.background
-    self.foreground = gtkStyle.props.foreground
-    self.italic = gtkStyle.props.italic
-    self.bold = gtkStyle.props.bold
-    self.underline = gtkStyle.props.underline
-    self.strikethrough = gtkStyle.props.strikethrough
+    index = self.comboTransform.get_active()
+    
+    if index >= 0:
+      self.gui.transform_colors(colorTransforms[index][1])
+      self.refresh()
+      
+  def on_save_toggled(self, button):
+    self.gui.savePalette = button.get_active()
     
-    # here we make sure every color starts with a hash
-    # maybe this is a workaround for a bug that I should file
-    # or maybe this is a false assumption
 
-    # if self.foreground and self.foreground[0] != '#':
-    #   self.foreground = '#' + self.foreground
+class SchemeBrowser:
+  """ Shows the installed schemes with a thumbnail of each. The thumbnails
+    are drawn (or read from the cache) by a pool of worker threads and put
+    in the view from the main loop as each one is ready.
+    Activating a scheme opens it in the editor.
+  """
+
+  def __init__(self, gui, workers=4):
+  
+    self.gui = gui
+    self.workers = workers
+    self.executor = None
+    self.generation = 0  # bumped on every refill, so late results are dropped
+    self.rows = {}  # scheme id -> row number in the store
+    self.thumbnailDir = os.path.join(GLib.get_user_cache_dir(), 'gedit-schemer', 'thumbnails')
+    
+    self.window = Gtk.Window(title='Style schemes', transient_for=gui.window,
+      destroy_with_parent=True, border_width=6)
+    self.window.set_default_size(560, 420)
+    self.window.connect('delete-event', self.on_delete)
+    
+    self.store = Gtk.ListStore(GdkPixbuf.Pixbuf, str, str)  # thumbnail, name, scheme id
+    
+    self.iconview = Gtk.IconView(model=self.store, pixbuf_column=0, text_column=1,
+      item_width=110, tooltip_column=2)
+    self.iconview.connect('item-activated', self.on_item_activated)
+    
+    scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+    scrolled.set_shadow_type(Gtk.ShadowType.IN)
+    scrolled.add(self.iconview)
+    self.window.add(scrolled)
+    
+  def show(self):
+  
+    self.fill()
+    self.window.show_all()
+    self.window.present()
+    
+  def fill(self):
+    """ List every installed scheme and start making the thumbnails """
+    
+    self.stop()
+    self.generation += 1
+    
+    manager = self.gui.schemeManager
+    schemes = [manager.get_scheme(schemeId) for schemeId in manager.get_scheme_ids()]
+    schemes.sort(key=lambda scheme: scheme.get_name().lower())
+    
+    self.rows = {}
+    self.iconview.set_model(None)
+    self.store.clear()
+    
+    for scheme in schemes:
+      self.rows[scheme.get_id()] = len(self.rows)
+      self.store.insert_with_valuesv(-1, [1, 2], [scheme.get_name(), scheme.get_id()])
       
-    # if self.background and self.background[0] != '#':
-    #   self.background = '#' + self.background
+    self.iconview.set_model(self.store)
     
+    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+    
+    for scheme in schemes:
+      filename = scheme.get_filename()
+      thumbnailFile = get_thumbnail_file(self.thumbnailDir, scheme.get_id(), filename)
+      
+      if thumbnailFile == None:
+        continue
+        
+      future = self.executor.submit(make_thumbnail, filename, thumbnailFile)
+      future.add_done_callback(lambda future, schemeId=scheme.get_id(),
+        generation=self.generation: GLib.idle_add(self.on_thumbnail_ready,
+          schemeId, generation, future))
+          
+  def on_thumbnail_ready(self, schemeId, generation, future):
+  
+    if generation != self.generation or future.cancelled():
+      return False
+      
+    thumbnailFile = future.result()
+    
+    if thumbnailFile != None:
+      try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(thumbnailFile)
+      except GLib.Error:
+        return False
+      self.store[self.rows[schemeId]][0] = pixbuf
+      
+    return False
+    
+  def on_item_activated(self, iconview, path):
+    self.gui.open_scheme(self.store[path][2])
+    
+  def on_delete(self, *args):
+  
+    self.stop()
+    self.window.hide()
+    return True
+    
+  def stop(self):
+    """ Drop the thumbnails that are not being worked on yet """
+    
+    if self.executor != None:
+      self.executor.shutdown(wait=False, cancel_futures=True)
+      self.executor = None
+      
 
 class GUI:
   
@@ -84,6 +515,9 @@ class GUI:
       'current-line', 'cursor', 'line-numbers', 'secondary-cursor',
       'selection', 'selection-unfocused', 'text']
 
+    # source mark category for the lines that use the selected style
+    self.markCategory = 'schemer-selected-style'
+
     # set up GUI widgets and signals
     
     GtkSource.View() # hack to get GtkSourceView widget to run from glade file
@@ -133,6 +567,13 @@ class GUI:
 
     self.builder.get_object('buttonCancel').connect('clicked', self.on_cancel_clicked)
     self.builder.get_object('buttonSave').connect('clicked', self.on_save_clicked)
+    self.builder.get_object('buttonPalette').connect('clicked', self.on_palette_clicked)
+    self.builder.get_object('buttonSchemes').connect('clicked', self.on_schemes_clicked)
+    self.builder.get_object('buttonMerge').connect('clicked', self.on_merge_clicked)
+    self.builder.get_object('checkbuttonContrast').connect('toggled', self.on_contrast_toggled)
+    
+    self.builder.get_object('treeviewcolumn1').set_cell_data_func(
+      self.builder.get_object('cellrendererspin1'), self.render_style_name)
     
     self.togglebuttonItalicHandler = self.togglebuttonItalic.connect(
       'toggled', self.on_style_changed)
@@ -150,12 +591,46 @@ class GUI:
     
     self.resetButton.connect('clicked', self.on_reset_clicked)
     
+    accelGroup = Gtk.AccelGroup()
+    accelGroup.connect(Gdk.KEY_z, Gdk.ModifierType.CONTROL_MASK, 0, self.on_undo)
+    accelGroup.connect(Gdk.KEY_z, Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK,
+      0, self.on_redo)
+    accelGroup.connect(Gdk.KEY_y, Gdk.ModifierType.CONTROL_MASK, 0, self.on_redo)
+    self.window.add_accel_group(accelGroup)
+    
     self.schemeManager = GtkSource.StyleSchemeManager().get_default() # requires gedit 3.3.3 or newer
-    self.languageManager = GtkSource.LanguageManager()
+    # share the manager gedit already loaded instead of reading every language again
+    self.languageManager = GtkSource.LanguageManager.get_default()
+    # names are translated in the domain of the loaded GtkSourceView, 3.0 or 4
+    self.languageCatalog = LanguageCatalog(self.languageManager.get_search_path(),
+      os.path.join(GLib.get_user_cache_dir(), 'gedit-schemer', 'languages.json'),
+      'gtksourceview-' + GtkSource._version)
+    # parsed schemes, so an unchanged scheme is not parsed again next time
+    self.schemeCache = SchemeCache(
+      os.path.join(GLib.get_user_cache_dir(), 'gedit-schemer', 'schemes'))
 
     self.dictAllStyles = collections.OrderedDict()
-    
-    languages = self.languageManager.get_language_ids()
+    self.history = EditHistory()
+    self.savePalette = False  # write shared colors as <color> definitions
+    self.paletteWindow = None
+    self.schemeBrowser = None
+    self.styleResolver = StyleResolver(self.dictAllStyles, self.get_style_fallback)
+    self.contrastAudit = ContrastAudit(self.dictAllStyles, self.styleResolver)
+    self.checkContrast = False
+    
+    self.styleModels = LRUCache(16)  # language id -> Gtk.ListStore of style names
+    self.timings = {}  # seconds spent filling the language and style lists
+    self.sampleGenerator = SampleGenerator(samples)
+    self.sampleSpec = None
+    self.sampleRegions = {}  # style id -> [(start, end)] offsets in the sample
+    # the lines using the selected style are marked in the gutter, since a tag
+    # on the text would hide the very attributes being previewed
+    markAttributes = GtkSource.MarkAttributes()
+    markAttributes.set_icon_name('go-next')
+    self.sourceView.set_mark_attributes(self.markCategory, markAttributes, 0)
+    self.sourceView.set_show_line_marks(True)
+    
+    languageNames = self.languageCatalog.get_names()
 
     self.geditApp = geditApp
     self.geditView = geditApp.get_default().get_active_window().get_active_view()
@@ -176,14 +651,31 @@ class GUI:
     if self.geditView:
       bufferLanguage = self.geditView.get_buffer().get_language()
 
-      if bufferLanguage and bufferLanguage.get_id() in languages:
+      if bufferLanguage and bufferLanguage.get_id() in languageNames:
         self.bufferLanguageId = bufferLanguage.get_id()
         self.bufferLanguageName = bufferLanguage.get_name()
         self.bufferLanguage = bufferLanguage
 
-    # watch temp directory to help the sample viewer
     self.schemeManagerOrigSearchPath = self.schemeManager.get_search_path()
-    self.schemeManager.append_search_path(tempfile.gettempdir())
+    self.searchPathChanged = False  # set once load_scheme adds a directory
+    self.schemeIndex = SchemeIndex(self.schemeManager)
+
+    # the sample viewer gets its own manager that only looks in a private temp
+    # directory holding nothing but the preview scheme, so a preview rescan
+    # never touches the installed schemes or the global manager
+    self.tempSchemeDir = tempfile.mkdtemp(prefix='gedit-schemer-')
+    self.previewManager = GtkSource.StyleSchemeManager()
+    self.previewManager.set_search_path([self.tempSchemeDir])
+    self.lastPreviewXml = None
+    self.previewScheduler = PreviewScheduler(self.update_sample_view)
+    
+    # watch the scheme file for changes made outside the editor. Saves done
+    # by other tools come as bursts of events, so they are handled together.
+    self.schemeMonitor = None
+    self.reloadScheduler = PreviewScheduler(self.reload_scheme_file, 300, debounce=True)
+    self.reloading = False  # set while a reload waits for the user
+    self.diskStyles = collections.OrderedDict()  # the styles as last read from the file
+    self.diskHeader = None  # get_header() as the scheme was loaded
 
     self.origSchemeFile = None
 
@@ -198,22 +690,23 @@ class GUI:
     self.langMapNameToId = {}
     
     # make a special case for Defaults which is moved to the top and includes GUI styles
-    self.liststoreLanguages.append(['  Default styles'])
+    langs = ['  Default styles']
     self.langMapNameToId['  Default styles'] = 'def'
     
-    langs = []
     
-    for thisLanguage in languages:
-      langName = self.languageManager.get_language(thisLanguage).get_name()
+    # only names are needed here, style ids are looked up when a language is selected
+    for thisLanguage, langName in languageNames.items():
       self.langMapNameToId[langName] = thisLanguage
       
-      if langName != 'Defaults':
+      if thisLanguage != 'def':
         langs.append(langName)
         
-    langs.sort(key=lambda y: y.lower())
+    langs[1:] = sorted(langs[1:], key=lambda y: y.lower())
     
-    for langName in langs:
-      self.liststoreLanguages.append([langName]);
+    startTime = time.time()
+    fill_model(self.comboboxLanguages, self.liststoreLanguages, langs)
+    self.timings['languages'] = time.time() - startTime
+    debug('filled %d languages in %.1f ms' % (len(langs), self.timings['languages'] * 1000))
         
     renderer_text = Gtk.CellRendererText()
     self.comboboxLanguages.pack_start(renderer_text, True)
@@ -230,13 +723,31 @@ class GUI:
     treeIter = self.treeviewStyles.get_model().get_iter_first()
     self.treeviewStylesSelection.select_iter(treeIter)
     model = self.treeviewStyles.get_model()
-    self.selectedStyleId = model[treeIter][0]
+    self.selectedStyleId = self.get_style_id(model[treeIter][0])
   
   def destroy(self, window):
+    self.cleanup()
     self.window.destroy()
     
+  def cleanup(self):
+    """ Undo everything this session did outside of its own window. Safe to
+      call more than once.
+    """
+    
+    self.previewScheduler.cancel()
+    self.reloadScheduler.cancel()
+    if self.schemeMonitor != None:
+      self.schemeMonitor.cancel()
+    if self.schemeBrowser != None:
+      self.schemeBrowser.stop()
+    # setting the path makes the global manager rescan for every window, so
+    # only put it back if this session actually changed it
+    if self.searchPathChanged:
+      self.schemeManager.set_search_path(self.schemeManagerOrigSearchPath)
+      self.searchPathChanged = False
+    shutil.rmtree(self.tempSchemeDir, ignore_errors=True)
+    
   def on_cancel_clicked(self, param):
-    self.schemeManager.set_search_path(self.schemeManagerOrigSearchPath)
     self.window.destroy()
 
   def on_save_clicked(self, param):
@@ -255,20 +766,17 @@ class GUI:
         self.currentScheme.get_id()   != self.entryId.get_text()):
       # make sure the new name/id does not conflict with one that exists already
       
-      schemeIds = self.schemeManager.get_scheme_ids()
+      if self.schemeIndex.conflicts(self.entryId.get_text(), self.entryName.get_text()):
+
+        text = '<span weight="bold" size="larger">There was a problem saving the scheme</span>' \
+          '\n\nYou have choosen to create a new scheme' \
+          '\nbut the Name or ID you are using is being used already.' \
+          '\n\nPlease be sure to choose a Name and ID that are not already in use.\n'
+        message_dialog(Gtk.MessageType.ERROR, text, parent=self.window,
+          buttons=Gtk.ButtonsType.NONE,
+          additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
 
-      for thisSchemeId in schemeIds:
-        if self.entryId.get_text() == thisSchemeId or self.entryName.get_text() == self.schemeManager.get_scheme(thisSchemeId).get_name():
-
-          text = '<span weight="bold" size="larger">There was a problem saving the scheme</span>' \
-            '\n\nYou have choosen to create a new scheme' \
-            '\nbut the Name or ID you are using is being used already.' \
-            '\n\nPlease be sure to choose a Name and ID that are not already in use.\n'
-          message_dialog(Gtk.MessageType.ERROR, text, parent=self.window,
-            buttons=Gtk.ButtonsType.NONE,
-            additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
-
-          return
+        return
 
       nameOrIdChange = True
 
@@ -302,62 +810,63 @@ class GUI:
       # make sure the name/ID to not refer to a system scheme that is not writable
       if inFile != outFile:
 
-        schemeIds = self.schemeManager.get_scheme_ids()
-
-        for thisSchemeId in schemeIds:
-          if self.entryId.get_text() == thisSchemeId or self.entryName.get_text() == self.schemeManager.get_scheme(thisSchemeId).get_name():
+        if self.schemeIndex.conflicts(self.entryId.get_text(), self.entryName.get_text()):
 
-            text = '<span weight="bold" size="larger">There was a problem saving the scheme</span>' \
-              '\n\nYou do not have permission to overwrite the scheme you have choosen.' \
-              '\nInstead a copy will be created.' \
-              '\n\nPlease be sure to choose a Name and ID that are not already in use.\n'
-            message_dialog(Gtk.MessageType.ERROR, text, parent=self.window,
-              buttons=Gtk.ButtonsType.NONE,
-              additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
+          text = '<span weight="bold" size="larger">There was a problem saving the scheme</span>' \
+            '\n\nYou do not have permission to overwrite the scheme you have choosen.' \
+            '\nInstead a copy will be created.' \
+            '\n\nPlease be sure to choose a Name and ID that are not already in use.\n'
+          message_dialog(Gtk.MessageType.ERROR, text, parent=self.window,
+            buttons=Gtk.ButtonsType.NONE,
+            additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
 
-            return
+          return
 
       # write the file. complain if it fails to save
-      if not self.write_scheme(outFile, self.entryId.get_text(), self.entryName.get_text()):
-        message_dialog(Gtk.MessageType.ERROR, 'Error saving theme',
+      result = self.write_scheme(outFile, self.entryId.get_text(), self.entryName.get_text())
+      
+      if not result:
+        message_dialog(Gtk.MessageType.ERROR, 'Error saving theme', escape(result.error),
           parent=self.window, buttons=Gtk.ButtonsType.NONE,
           additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
           
       else:
-        self.schemeManager.force_rescan()
+        self.schemeIndex.force_rescan()
         updatedScheme = self.schemeManager.get_scheme(self.entryId.get_text())
 
         s = Gio.Settings('org.gnome.gedit.preferences.editor')
         s.set_string('scheme', self.entryId.get_text())
 
-        # update the view in all open documents
-        for thisDoc in self.geditApp.get_default().get_documents():
-          thisDoc.set_style_scheme(updatedScheme)
+        # update the view in all open documents, visible ones first
+        SchemePropagator(updatedScheme).start(self.geditApp.get_default())
 
     else:
       message_dialog(Gtk.MessageType.ERROR, 'Error saving theme',
         buttons=Gtk.ButtonsType.NONE, parent=self.window,
         additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL))
 
-    self.schemeManager.set_search_path(self.schemeManagerOrigSearchPath)
     self.window.destroy()
 
   def load_scheme(self, schemeIdOrFile):
     """ Load a scheme from a file or an existing scheme ID """
 
+    schemeFile = None
+    
     if os.path.isfile(schemeIdOrFile):
       
       directory = os.path.dirname(schemeIdOrFile)
     
       if directory not in self.schemeManager.get_search_path():
         self.schemeManager.prepend_search_path(directory)
+        self.searchPathChanged = True
+        self.schemeIndex.invalidate()
       
-      fp = open(schemeIdOrFile, 'r')
-      xmlTree = ET.parse(fp)
-      fp.close()
-
-      if xmlTree.getroot().tag == 'style-scheme':
-        thisScheme = self.schemeManager.get_scheme(xmlTree.getroot().attrib['id'])
+      schemeFile = self.schemeCache.parse(schemeIdOrFile)
+      
+      if schemeFile == None:
+        return False
+        
+      thisScheme = self.schemeManager.get_scheme(schemeFile.id)
       
       if thisScheme == None:
         return False
@@ -375,50 +884,147 @@ class GUI:
         
         return False
         
-      self.origSchemeFile = schemeIdOrFile
-
     else:
 
       thisScheme = self.schemeManager.get_scheme(schemeIdOrFile)
     
       if thisScheme == None:
         return False
+        
+      # get all the style elements
+      # since there are no API calls to do this, we parse the XML file for now
+      # also works around this https://bugzilla.gnome.org/show_bug.cgi?id=667194
+      schemeFile = self.schemeCache.parse(thisScheme.get_filename())
+      
+      if schemeFile == None:
+        return False
     
     self.currentScheme = thisScheme
+    self.origSchemeFile = thisScheme.get_filename()
     
     self.entryName.set_text( thisScheme.get_name() )
     self.entryAuthor.set_text(', '.join(thisScheme.get_authors()))
     self.entryDescription.set_text(thisScheme.get_description())
     self.entryId.set_text(thisScheme.get_id())
     
-    # get all the style elements
-    # since there are no API calls to do this, we parse the XML file for now
-    # also works around this https://bugzilla.gnome.org/show_bug.cgi?id=667194
-    self.origSchemeFile = self.currentScheme.get_filename()
-    
-    fp = open(self.origSchemeFile, 'r')
-    xmlTree = ET.parse(fp)
-    fp.close()
-    styleElements = xmlTree.findall('style')
-    
     self.dictAllStyles.clear()
-    for styleElement in styleElements:
-      thisStyle = self.currentScheme.get_style(styleElement.attrib['name'])
-      styleProps = Props()
-      
-      styleProps.from_gtk_source_style(thisStyle)
-      
-      self.dictAllStyles[styleElement.attrib['name']] = styleProps;
+    self.dictAllStyles.update(schemeFile.styles)
+    self.history.clear()
+    self.contrastAudit.clear()
+    
+    self.diskStyles = collections.OrderedDict((styleId, props.copy())
+      for styleId, props in schemeFile.styles.items())
+    self.diskHeader = self.get_header()
+    self.watch_scheme_file()
             
     self.sourceBuffer.set_style_scheme(self.currentScheme);
     
     # set up temp file so the sample view can be updated
     self.tempSchemeId = thisScheme.get_id() + '_temp'
     self.tempSchemeName = thisScheme.get_name() + '_temp'
-    self.tempSchemeFile = tempfile.gettempdir() + '/' + self.tempSchemeId + '.xml'
+    self.tempSchemeFile = os.path.join(self.tempSchemeDir, self.tempSchemeId + '.xml')
+    self.lastPreviewXml = None
     
     return True
     
+  def watch_scheme_file(self):
+    """ Start watching the file of the loaded scheme """
+    
+    if self.schemeMonitor != None:
+      self.schemeMonitor.cancel()
+      
+    self.reloadScheduler.cancel()
+    
+    try:
+      self.schemeMonitor = Gio.File.new_for_path(self.origSchemeFile).monitor_file(
+        Gio.FileMonitorFlags.NONE, None)
+    except GLib.Error:
+      self.schemeMonitor = None
+      return
+      
+    self.schemeMonitor.connect('changed', self.on_scheme_file_changed)
+    
+  def on_scheme_file_changed(self, monitor, changedFile, otherFile, eventType):
+  
+    if eventType != Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+      self.reloadScheduler.schedule()
+      
+  def reload_scheme_file(self):
+    """ Bring in the styles that changed in the scheme file since it was
+      read. Edits made here are kept; if the file changed the same style
+      attributes, the user chooses which side wins.
+    """
+    
+    # the conflict dialog runs the main loop, so more file events can come
+    # in while a reload is in progress. Try again once it is done.
+    if self.reloading:
+      self.reloadScheduler.schedule()
+      return
+      
+    self.reloading = True
+    
+    try:
+      self.merge_scheme_file()
+    finally:
+      self.reloading = False
+      
+  def merge_scheme_file(self):
+  
+    try:
+      schemeFile = self.schemeCache.parse(self.origSchemeFile)
+    except (OSError, ET.ParseError):
+      # most likely caught halfway through a write, the next event retries
+      return
+      
+    if schemeFile == None:
+      return
+      
+    diskStyles = schemeFile.styles
+    merged, conflicts = merge_schemes(self.diskStyles, self.dictAllStyles, diskStyles)
+    
+    if conflicts:
+      text = '<span weight="bold" size="larger">The scheme was changed on disk</span>' \
+        '\n\nThe file has changes to %d style attributes you have edited too.' \
+        '\nChanges to other styles have been brought in either way.\n' % len(conflicts)
+      response = message_dialog(Gtk.MessageType.WARNING, text, parent=self.window,
+        buttons=Gtk.ButtonsType.NONE,
+        additional_buttons=('Keep my edits', Gtk.ResponseType.CANCEL,
+          'Use the file', Gtk.ResponseType.ACCEPT))
+          
+      if response == Gtk.ResponseType.ACCEPT:
+        merged, conflicts = merge_schemes(self.diskStyles, diskStyles, self.dictAllStyles)
+        
+    self.diskStyles = diskStyles
+    
+    changed = self.replace_styles(merged)
+    debug('reloaded %d styles from %s' % (len(changed), self.origSchemeFile))
+    
+  def replace_styles(self, styles):
+    """ Make dictAllStyles hold the given styles, touching only the styles
+      that differ, as one undo entry and one preview refresh. Returns the
+      (style name, packed style from before) of the changed styles.
+    """
+    
+    changed = []
+    
+    for styleId in style_ids(self.dictAllStyles, styles):
+      before = self.get_packed_style(styleId)
+      after = styles[styleId] if styleId in styles else None
+      
+      if before == (after.packed() if after != None else None):
+        continue
+        
+      changed.append((styleId, before))
+      
+      if after != None:
+        self.dictAllStyles[styleId] = after
+      else:
+        del self.dictAllStyles[styleId]
+        
+    self.apply_style_changes(changed)
+    
+    return changed
+    
   def clear_and_disable_style_buttons(self):
 
     self.colorbuttonForeground.set_color(self.colorBlack)
@@ -438,63 +1044,334 @@ class GUI:
   def update_sample_view(self):
     """
     Update the sample shown in the GUI.
-    To do this we must write the scheme to disk and reload it from there.
+    The scheme is built in memory and only written out (and rescanned by the
+    preview manager) when it actually differs from what is being shown.
     """
     
-    # write it to disk
-    self.write_scheme(self.tempSchemeFile, self.tempSchemeId, self.tempSchemeName)
+    output = self.scheme_to_xml(self.tempSchemeId, self.tempSchemeName)
+    
+    if output == self.lastPreviewXml:
+      return
+    
+    try:
+      fp = open(self.tempSchemeFile, 'w')
+      fp.write(output)
+      fp.close()
+    except:
+      return
     
-    # and reload it from disk
-    self.schemeManager.force_rescan()
+    # the preview manager only watches the temp directory, so this rescan
+    # costs the same no matter how many schemes are installed
+    self.previewManager.force_rescan()
     
-    newScheme = self.schemeManager.get_scheme(self.tempSchemeId)
+    newScheme = self.previewManager.get_scheme(self.tempSchemeId)
     self.sourceBuffer.set_style_scheme(newScheme);
     
-  def write_scheme(self, location, schemeId, schemeName):
+    self.lastPreviewXml = output
+    
+    if self.paletteWindow != None:
+      self.paletteWindow.refresh()
+    
+  def write_scheme(self, location, schemeId, schemeName, atomic=True, fsync=True):
     """Write the scheme to disk
     
     location -- the file location to write to
     schemeId -- the ID of the scheme
+    atomic -- write a sibling temp file and rename it over location, so a
+      failed write never leaves a truncated scheme behind
+    fsync -- flush the data to the disk before renaming (atomic only)
+    
+    Returns a SaveResult, which is false when the write failed.
+    """
+    
+    palette = name_colors(self.dictAllStyles) if self.savePalette else None
+    
+    def write(fp):
+      write_scheme_xml(fp, schemeId, schemeName, self.entryAuthor.get_text(),
+        self.entryDescription.get_text(), self.dictAllStyles, palette)
+    
+    return save_file(location, write, atomic, fsync)
+    
+  def scheme_to_xml(self, schemeId, schemeName):
+    """Build the XML document for the scheme in memory
+    
+    schemeId -- the ID of the scheme
+    schemeName -- the name of the scheme
     """
 
-    output = '<style-scheme name="'+ schemeName + '" id="'+ schemeId +'" version="1.0">\n'
+    output = io.StringIO()
+    
+    write_scheme_xml(output, schemeId, schemeName, self.entryAuthor.get_text(),
+      self.entryDescription.get_text(), self.dictAllStyles)
     
-    output += '  <author>'+ self.entryAuthor.get_text() +'</author>\n'
-    output += '  <description>'+ self.entryDescription.get_text() +'</description>\n\n'
+    return output.getvalue()
     
-    for k, v in list(self.dictAllStyles.items()):
-      output += '  <style name="'+k+'"\t'
+  def get_packed_style(self, styleId):
+    """ Return the packed form of a style, or None if the scheme lacks it """
+    
+    props = self.dictAllStyles.get(styleId)
+    return props.packed() if props != None else None
+    
+  def record_edit(self, styleId, before):
+    """ Add the change of a style since before to the undo history """
+    
+    self.history.record(styleId, before, self.get_packed_style(styleId))
+    self.style_edited(styleId)
+    
+  def style_edited(self, *styleIds):
+    """ Drop the cached contrast results that depend on edited styles """
+    
+    for styleId in styleIds:
+      self.contrastAudit.invalidate(styleId)
       
-      if (v.foreground): output += 'foreground="'+ v.foreground +'" '
-      if (v.background): output += 'background="'+ v.background +'" '
-      if (v.italic): output += 'italic="true" '
-      if (v.bold): output += 'bold="true" '
-      if (v.underline):  output += 'underline="true" '
-      if (v.strikethrough):  output += 'strikethrough="true" '
+    if self.checkContrast:
+      self.treeviewStyles.queue_draw()
       
-      output += '/>\n'
+  def on_contrast_toggled(self, button):
+  
+    self.checkContrast = button.get_active()
+    self.treeviewStyles.queue_draw()
     
-    output  += '</style-scheme>\n'
+  def render_style_name(self, column, renderer, model, treeIter, data):
+    """ Mark styles with too little contrast while contrast checking is on.
+      Only the rows being drawn are looked at, and the ratios are cached.
+    """
     
-    try:
-      fp = open(location, 'w')
-      fp.write(output)
-      fp.close()
-    except:
-      return False
-
+    name = model[treeIter][0]
+    
+    if self.checkContrast:
+      styleId = self.get_style_id(name)
+      if self.contrastAudit.is_low(styleId):
+        renderer.props.text = '%s  (%.1f:1)' % (name, self.contrastAudit.get_ratio(styleId))
+        renderer.props.foreground = 'red'
+        return
+        
+    renderer.props.foreground_set = False
+    
+  def get_style_fallback(self, styleId):
+    """ Return the style a language maps styleId to, as in its .lang file """
+    
+    if ':' not in styleId:
+      return None
+      
+    language = self.languageManager.get_language(styleId.split(':', 1)[0])
+    
+    if language == None:
+      return None
+      
+    return language.get_style_fallback(styleId)
+    
+  def get_style_id(self, name):
+    """ Return the full id of a style listed for the selected language """
+    
+    styleId = self.selectedLanguageId + ':' + name
+    
+    # handle the special case for GUI styles
+    if styleId not in self.dictAllStyles and self.selectedLanguageId == 'def':
+      styleId = name
+      
+    return styleId
+    
+  def on_undo(self, *args):
+    self.step_history(self.history.undo)
+    return True
+    
+  def on_redo(self, *args):
+    self.step_history(self.history.redo)
     return True
     
+  def step_history(self, step):
+    """ Undo or redo one entry. The style buttons are only refreshed when
+      it touched the selected style.
+    """
+    
+    edits = step(self.dictAllStyles)
+    
+    if not edits:
+      return
+      
+    self.style_edited(*[edit.styleId for edit in edits])
+    
+    if any(edit.styleId == self.selectedStyleId for edit in edits):
+      self.on_style_selected(self.treeviewStylesSelection)
+      
+    self.previewScheduler.schedule()
+    
+  def on_merge_clicked(self, param):
+    """ Ask for a common base and another version of the scheme and merge
+      the other version's changes into the styles being edited
+    """
+    
+    dialog = Gtk.Dialog(title='Merge a scheme', transient_for=self.window, modal=True)
+    dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+      'Merge', Gtk.ResponseType.ACCEPT)
+      
+    fileFilter = Gtk.FileFilter()
+    fileFilter.set_name('Style schemes')
+    fileFilter.add_pattern('*.xml')
+    
+    grid = Gtk.Grid(row_spacing=6, column_spacing=12, border_width=6)
+    choosers = []
+    
+    for row, label in enumerate(('Common base', 'Other version')):
+      chooser = Gtk.FileChooserButton(title=label, hexpand=True)
+      chooser.add_filter(fileFilter)
+      grid.attach(Gtk.Label(label=label, xalign=0), 0, row, 1, 1)
+      grid.attach(chooser, 1, row, 1, 1)
+      choosers.append(chooser)
+      
+    dialog.get_content_area().add(grid)
+    dialog.show_all()
+    
+    response = dialog.run()
+    baseFile, theirsFile = [chooser.get_filename() for chooser in choosers]
+    dialog.destroy()
+    
+    if response == Gtk.ResponseType.ACCEPT and baseFile and theirsFile:
+      self.merge_scheme_files(baseFile, theirsFile)
+      
+  def merge_scheme_files(self, baseFile, theirsFile):
+    """ Three-way merge the styles of theirsFile into dictAllStyles, with
+      baseFile as the common ancestor. Where both changed an attribute the
+      edited value is kept and the conflict is shown. The result is saved
+      with the rest of the scheme.
+    """
+    
+    schemes = []
+    
+    for filename in (baseFile, theirsFile):
+      try:
+        scheme = self.schemeCache.parse(filename)
+      except (OSError, ET.ParseError):
+        scheme = None
+        
+      if scheme == None:
+        message_dialog(Gtk.MessageType.ERROR, 'Unable to read the scheme',
+          escape(filename), parent=self.window)
+        return
+        
+      schemes.append(scheme)
+      
+    base, theirs = schemes
+    merged, conflicts = merge_schemes(base.styles, self.dictAllStyles, theirs.styles)
+    
+    changed = self.replace_styles(merged)
+    
+    if conflicts:
+      details = '\n'.join(escape('%s %s: base %s, other %s, kept %s' % (conflict.styleId,
+        conflict.attribute, describe_value(conflict.attribute, conflict.base),
+        describe_value(conflict.attribute, conflict.theirs),
+        describe_value(conflict.attribute, conflict.ours))) for conflict in conflicts)
+      text = '<span weight="bold" size="larger">Merged with conflicts</span>' \
+        '\n\n%d styles were changed. %d attributes were changed on both sides;' \
+        '\nfor those the values being edited were kept.\n' % (len(changed), len(conflicts))
+      message_dialog(Gtk.MessageType.WARNING, text, details, parent=self.window)
+      
+  def on_schemes_clicked(self, param):
+  
+    if self.schemeBrowser == None:
+      self.schemeBrowser = SchemeBrowser(self)
+      
+    self.schemeBrowser.show()
+    
+  def open_scheme(self, schemeId):
+    """ Switch the editor to another installed scheme, after asking if
+      there are edits to the current one that would be lost
+    """
+    
+    if self.has_unsaved_edits():
+      text = '<span weight="bold" size="larger">Open another scheme?</span>' \
+        '\n\nThe changes you made to this scheme have not been saved' \
+        '\nand will be lost.\n'
+      response = message_dialog(Gtk.MessageType.WARNING, text, parent=self.window,
+        buttons=Gtk.ButtonsType.NONE,
+        additional_buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+          'Discard changes', Gtk.ResponseType.ACCEPT))
+          
+      if response != Gtk.ResponseType.ACCEPT:
+        return
+        
+    self.previewScheduler.cancel()
+    
+    if not self.load_scheme(schemeId):
+      return
+      
+    self.on_style_selected(self.treeviewStylesSelection)
+    
+    if self.paletteWindow != None:
+      self.paletteWindow.refresh()
+      
+    if self.checkContrast:
+      self.treeviewStyles.queue_draw()
+      
+  def get_header(self):
+    """ Return the name, author, description and id entered for the scheme """
+    
+    return tuple(entry.get_text() for entry in (self.entryName, self.entryAuthor,
+      self.entryDescription, self.entryId))
+      
+  def has_unsaved_edits(self):
+    """ Return true if the scheme was edited since it was read. Styles
+      brought in from the file by a reload do not count.
+    """
+    
+    if self.get_header() != self.diskHeader:
+      return True
+      
+    if len(self.dictAllStyles) != len(self.diskStyles):
+      return True
+      
+    return any(self.diskStyles.get(styleId) != props
+      for styleId, props in self.dictAllStyles.items())
+    
+  def on_palette_clicked(self, param):
+  
+    if self.paletteWindow == None:
+      self.paletteWindow = PaletteWindow(self)
+      
+    self.paletteWindow.show()
+    
+  def recolor(self, oldColor, newColor):
+    """ Replace a color in every style using it, as one preview refresh """
+    
+    self.apply_style_changes(Palette(self.dictAllStyles).recolor(oldColor, newColor))
+    
+  def transform_colors(self, transform):
+    """ Run a color transform (see colors.py) over the whole scheme """
+    
+    self.apply_style_changes(colors.transform_styles(self.dictAllStyles, transform))
+    
+  def apply_style_changes(self, changed):
+    """ Record styles changed in bulk for undo, then refresh the style
+      buttons and the preview once
+      
+    changed -- list of (style name, packed style from before the change)
+    """
+    
+    if not changed:
+      return
+      
+    self.history.record_group([(styleId, before, self.get_packed_style(styleId))
+      for styleId, before in changed])
+    self.style_edited(*[styleId for styleId, before in changed])
+      
+    if self.selectedStyleId in dict(changed):
+      self.on_style_selected(self.treeviewStylesSelection)
+      
+    self.previewScheduler.schedule()
+    
   def on_reset_clicked(self, param):
     
     if self.selectedStyleId in self.dictAllStyles:
     
+      before = self.get_packed_style(self.selectedStyleId)
       del self.dictAllStyles[self.selectedStyleId]
+      self.record_edit(self.selectedStyleId, before)
     
       # reset the GUI
       self.clear_and_disable_style_buttons()
       
-      self.update_sample_view()
+      self.previewScheduler.schedule()
       
   def on_background_toggled(self, param):
     
@@ -509,6 +1386,8 @@ class GUI:
     else:
       self.colorbuttonBackground.set_sensitive(False)
       
+      before = self.get_packed_style(self.selectedStyleId)
+      
       try:
         self.dictAllStyles[self.selectedStyleId].background = None;
         
@@ -517,7 +1396,8 @@ class GUI:
       except:
         pass
 
-      self.update_sample_view()
+      self.record_edit(self.selectedStyleId, before)
+      self.previewScheduler.schedule()
       
   def on_foreground_toggled(self, param):
     
@@ -532,13 +1412,16 @@ class GUI:
     else:
       self.colorbuttonForeground.set_sensitive(False)
       
+      before = self.get_packed_style(self.selectedStyleId)
+      
       try:
         self.dictAllStyles[self.selectedStyleId].foreground = None;
         self.clear_style_if_empty(self.selectedStyleId)
       except:
         pass
         
-      self.update_sample_view()
+      self.record_edit(self.selectedStyleId, before)
+      self.previewScheduler.schedule()
   
   def clear_style_if_empty(self, styleId):
     """ Check to see if there are no attribtes set for a style. If so disable the
@@ -557,7 +1440,9 @@ class GUI:
     """ Handles button clicks for foreground color, background color, 
       bold, italic, underline, or strikethrough.
     """
-        
+    
+    before = self.get_packed_style(self.selectedStyleId)
+    
     if self.selectedStyleId not in self.dictAllStyles:
       self.dictAllStyles[self.selectedStyleId] = Props()
     
@@ -593,7 +1478,8 @@ class GUI:
     
     self.clear_style_if_empty(self.selectedStyleId)
     
-    self.update_sample_view()
+    self.record_edit(self.selectedStyleId, before)
+    self.previewScheduler.schedule()
     
   def on_style_selected(self, selection):
     model, treeiter = selection.get_selected()
@@ -602,11 +1488,7 @@ class GUI:
     if treeiter == None:
       return
     
-    self.selectedStyleId = self.selectedLanguageId + ':' + model[treeiter][0]
-
-    # handle the special case for GUI styles
-    if self.selectedStyleId not in self.dictAllStyles and self.selectedLanguageId == 'def':
-      self.selectedStyleId = model[treeiter][0]
+    self.selectedStyleId = self.get_style_id(model[treeiter][0])
     
     # block all the toggle handlers so they dont get triggered
     self.togglebuttonItalic.handler_block(self.togglebuttonItalicHandler)
@@ -652,6 +1534,8 @@ class GUI:
     else:
       self.clear_and_disable_style_buttons()
       
+    self.show_inherited_style(self.selectedStyleId)
+      
     # unblock toggle handlers so the user can do stuff
     self.togglebuttonItalic.handler_unblock(self.togglebuttonItalicHandler)
     self.togglebuttonBold.handler_unblock(self.togglebuttonBoldHandler)
@@ -659,7 +1543,101 @@ class GUI:
     self.togglebuttonStrikethrough.handler_unblock(self.togglebuttonStrikethroughHandler)
     self.checkbuttonBackground.handler_unblock(self.checkbuttonBackgroundHandler)
     self.checkbuttonForeground.handler_unblock(self.checkbuttonForegroundHandler)
+    
+    self.highlight_style(self.selectedStyleId)
+    
+  def show_inherited_style(self, styleId):
+    """ Show the colors a style that the scheme does not set is drawn with,
+      through its map-to chain. The color buttons stay disabled.
+    """
+    
+    source = self.styleResolver.resolve(styleId)
+    
+    tooltip = None
+    
+    if source != None and source != styleId:
+      inherited = self.dictAllStyles[source]
+      
+      if inherited.foreground:
+        self.colorbuttonForeground.set_color(Gdk.color_parse(inherited.foreground))
+      if inherited.background:
+        self.colorbuttonBackground.set_color(Gdk.color_parse(inherited.background))
+        
+      tooltip = 'Inherited from ' + source
+      
+    for widget in (self.colorbuttonForeground, self.colorbuttonBackground,
+        self.checkbuttonForeground, self.checkbuttonBackground):
+      widget.set_tooltip_text(tooltip)
+    
+  def highlight_style(self, styleId):
+    """ Mark the lines of the sample that use a style and scroll to the
+      first one. The regions come from the index made for the sample.
+    """
+    
+    start, end = self.sourceBuffer.get_bounds()
+    self.sourceBuffer.remove_source_marks(start, end, self.markCategory)
+    
+    regions = self.sampleRegions.get(styleId)
+    
+    if not regions:
+      return
+      
+    markedLines = set()
+    
+    for regionStart, regionEnd in regions:
+      firstLine = self.sourceBuffer.get_iter_at_offset(regionStart).get_line()
+      lastLine = self.sourceBuffer.get_iter_at_offset(max(regionStart, regionEnd - 1)).get_line()
+      
+      for line in range(firstLine, lastLine + 1):
+        if line not in markedLines:
+          markedLines.add(line)
+          self.sourceBuffer.create_source_mark(None, self.markCategory,
+            self.sourceBuffer.get_iter_at_line(line))
+        
+
+    self.sourceView.scroll_to_iter(self.sourceBuffer.get_iter_at_offset(regions[0][0]),
+      0.1, False, 0, 0)
   
+  def get_style_model(self, languageId, language):
+    """ Return a ListStore holding the style names of a language. It is
+      filled while detached from the tree view and kept in an LRU cache, so
+      switching back to a language reuses it.
+    """
+    
+    store = self.styleModels.get(languageId)
+    
+    if store != None:
+      return store
+      
+    startTime = time.time()
+    
+    rows = []
+    
+    if language != None:
+    
+      # remove the language namespace thing from the style name
+      removeLen = len(languageId) + 1
+      
+      styleIds = language.get_style_ids() # TODO: why is 'gtk-doc.lang' throwing a warning?
+      
+      styleIds.sort() # make the styles list alphabetical
+      
+      if languageId == 'def':
+        rows += self.guiStyleIds
+        
+      rows += [styleId[removeLen:] for styleId in styleIds]
+      
+    store = Gtk.ListStore(str)
+    fill_model(None, store, rows)
+    
+    self.styleModels[languageId] = store
+    
+    self.timings['styles:' + languageId] = time.time() - startTime
+    debug('filled %d %s styles in %.1f ms' % (len(rows), languageId,
+      self.timings['styles:' + languageId] * 1000))
+    
+    return store
+    
   def on_language_selected(self, combo):
 
     tree_iter = combo.get_active_iter()
@@ -668,25 +1646,11 @@ class GUI:
       self.selectedLanguageName = model[tree_iter][0]
       self.selectedLanguageId = self.langMapNameToId[self.selectedLanguageName]
       
-      self.liststoreStyles.clear()
-      
-      # remove the language namespace thing from the style name
-      removeLen = len(self.selectedLanguageId) + 1
-      
       thisLanguage = self.languageManager.get_language(self.selectedLanguageId)
       
-      if thisLanguage != None:
-      
-        styleIds = thisLanguage.get_style_ids() # TODO: why is 'gtk-doc.lang' throwing a warning?
-        
-        styleIds.sort() # make the styles list alphabetical
-        
-        if self.selectedLanguageId == 'def':
-          for styleId in self.guiStyleIds:
-            self.liststoreStyles.append([styleId])
-        
-        for styleId in styleIds:
-          self.liststoreStyles.append([styleId[removeLen:]])
+      # swap in the prepared style list instead of refilling the shown one
+      self.liststoreStyles = self.get_style_model(self.selectedLanguageId, thisLanguage)
+      self.treeviewStyles.set_model(self.liststoreStyles)
       
       # select the first style in the list
       treeIter = self.treeviewStyles.get_model().get_iter_first()
@@ -694,10 +1658,21 @@ class GUI:
       if treeIter != None:  # make sure the list is not empty since some languages have no styles
         self.treeviewStylesSelection.select_iter(treeIter)
         model = self.treeviewStyles.get_model()
-        self.selectedStyleId = model[treeIter][0]
+        self.selectedStyleId = self.get_style_id(model[treeIter][0])
       
-      # update the sample view
-      if self.selectedLanguageId in samples:
+      # update the sample view, preferably with a sample that shows every
+      # style of the selected language
+      self.sampleSpec, sampleText = self.sampleGenerator.get(self.selectedLanguageId,
+        self.languageCatalog.get_filename(self.selectedLanguageId))
+      
+      self.sampleRegions = {}
+      
+      if sampleText and thisLanguage != None:
+        self.sourceBuffer.set_language(thisLanguage);
+        self.sourceBuffer.set_text(sampleText)
+        self.labelSample.set_text(self.selectedLanguageName + ' sample')
+        self.sampleRegions = self.sampleGenerator.get_regions(self.selectedLanguageId)
+      elif self.selectedLanguageId in samples:
         self.sourceBuffer.set_language(thisLanguage);
         self.sourceBuffer.set_text(samples[self.selectedLanguageId])
         self.labelSample.set_text(self.selectedLanguageName + ' sample')
@@ -709,6 +1684,8 @@ class GUI:
         self.sourceBuffer.set_language(self.defaultLanguage);
         self.sourceBuffer.set_text(samples[self.defaultLanguageId])
         self.labelSample.set_text(self.defaultLanguageName + ' sample')
+        
+      self.highlight_style(self.selectedStyleId)
 
 
 
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+#
+# Gedit Scheme Editor
+# https://github.com/jonocodes/GeditSchemer
+#
+# Copyright (C) Jono Finger 2013 <jono@foodnotblogs.com>
+#
+# The program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# The program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Small pictures of a scheme for the scheme browser
+#
+# A thumbnail is a few lines of made up code drawn as colored bars, one bar
+# per token, on the text background. It is drawn from the parsed scheme with
+# plain Python and written as a PNG, so it can be made in a worker thread
+# without touching GTK. Thumbnails are cached as files named after the scheme
+# id and the modification time and size of the scheme file; the older ones of
+# a scheme are removed when a new one is written.
+
+import os
+import glob
+import zlib
+import tempfile
+import struct
+
+from .scheme import parse_scheme
+
+
+# the made up code: lines of (style id, length in characters), None is a space
+sampleLines = [
+  [('def:comment', 22)],
+  [('def:preprocessor', 8), (None, 1), ('def:string', 9)],
+  [],
+  [('def:type', 3), (None, 1), ('def:function', 6), ('text', 6), (None, 1), ('text', 1)],
+  [(None, 2), ('def:keyword', 2), (None, 1), ('text', 5), (None, 1), ('def:number', 2),
+    ('text', 1)],
+  [(None, 4), ('def:function', 6), ('text', 1), ('def:string', 11), ('text', 2)],
+  [(None, 2), ('def:keyword', 6), (None, 1), ('def:constant', 5), ('text', 1)],
+  [('text', 1)],
+]
+
+# the line drawn with the current-line background
+currentLine = 4
+
+charWidth = 3
+lineHeight = 8
+barHeight = 4
+margin = 4
+
+width = margin * 2 + charWidth * 26
+height = margin * 2 + lineHeight * len(sampleLines)
+
+defaultForeground = 0x000000
+defaultBackground = 0xffffff
+
+
+def get_color(styles, styleId, attribute, default):
+  """ Return a packed color of a style, falling back to the text style """
+
+  for source in (styleId, 'text'):
+    props = styles.get(source)
+    if props != None and isinstance(getattr(props, attribute), int):
+      return getattr(props, attribute)
+
+  return default
+
+
+def pixel(color):
+  return struct.pack('>I', color)[1:]
+
+
+def draw_thumbnail(styles):
+  """ Return the rows of a thumbnail as bytearrays of RGB pixels """
+
+  background = get_color(styles, 'text', 'bg', defaultBackground)
+  current = get_color(styles, 'current-line', 'bg', background)
+
+  rows = []
+
+  for lineIndex, tokens in enumerate(sampleLines):
+    lineBackground = current if lineIndex == currentLine else background
+    empty = bytearray(pixel(lineBackground) * width)
+    bar = bytearray(empty)
+
+    x = margin
+
+    for styleId, length in tokens:
+      end = x + length * charWidth
+
+      if styleId != None:
+        tokenBackground = get_color(styles, styleId, 'bg', lineBackground)
+        if tokenBackground != lineBackground:
+          empty[x * 3:end * 3] = bar[x * 3:end * 3] = pixel(tokenBackground) * (end - x)
+
+        # leave a pixel between characters so the bars read as text
+        color = pixel(get_color(styles, styleId, 'fg', defaultForeground))
+        for start in range(x, end, charWidth):
+          bar[start * 3:(start + charWidth - 1) * 3] = color * (charWidth - 1)
+
+      x = end
+
+    top = (lineHeight - barHeight) // 2
+
+    for y in range(lineHeight):
+      rows.append(bar if top <= y < top + barHeight else empty)
+
+  background = bytearray(pixel(background) * width)
+
+  return [background] * margin + rows + [background] * margin
+
+
+def write_png(fp, rows):
+  """ Write RGB rows as a PNG to a binary file """
+
+  def chunk(kind, data):
+    fp.write(struct.pack('>I', len(data)) + kind + data +
+      struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+  fp.write(b'\x89PNG\r\n\x1a\n')
+  chunk(b'IHDR', struct.pack('>IIBBBBB', len(rows[0]) // 3, len(rows), 8, 2, 0, 0, 0))
+  chunk(b'IDAT', zlib.compress(b''.join(b'\x00' + bytes(row) for row in rows)))
+  chunk(b'IEND', b'')
+
+
+def get_thumbnail_file(directory, schemeId, filename):
+  """ Return the path of the cached thumbnail of a scheme, or None if the
+    scheme file cannot be read
+  """
+
+  try:
+    st = os.stat(filename)
+  except OSError:
+    return None
+
+  return os.path.join(directory, '%s-%d-%d.png' % (schemeId, st.st_mtime_ns, st.st_size))
+
+
+def make_thumbnail(filename, thumbnailFile):
+  """ Draw the thumbnail of a scheme file unless it is cached already.
+    Returns thumbnailFile, or None if the scheme could not be drawn.
+  """
+
+  if os.path.isfile(thumbnailFile):
+    return thumbnailFile
+
+  try:
+    scheme = parse_scheme(filename)
+  except Exception:
+    return None
+
+  if scheme == None:
+    return None
+
+  rows = draw_thumbnail(scheme.styles)
+
+  try:
+    os.makedirs(os.path.dirname(thumbnailFile), exist_ok=True)
+  except OSError:
+    return None
+
+  directory = os.path.dirname(thumbnailFile)
+  tempPath = None
+
+  # a unique temp file, since a refill of the browser can start on a scheme
+  # while a worker from before is still drawing it
+  try:
+    fd, tempPath = tempfile.mkstemp(prefix='.' + os.path.basename(thumbnailFile) + '.',
+      suffix='.tmp', dir=directory)
+    with os.fdopen(fd, 'wb') as fp:
+      write_png(fp, rows)
+    os.replace(tempPath, thumbnailFile)
+    tempPath = None
+  except OSError:
+    return None
+  finally:
+    if tempPath:
+      try:
+        os.remove(tempPath)
+      except OSError:
+        pass
+
+  remove_old_thumbnails(thumbnailFile)
+
+  return thumbnailFile
+
+
+def remove_old_thumbnails(thumbnailFile):
+  """ Delete the thumbnails drawn for earlier versions of the same scheme """
+
+  prefix = os.path.basename(thumbnailFile).rsplit('-', 2)[0]
+  pattern = os.path.join(glob.escape(os.path.dirname(thumbnailFile)),
+    glob.escape(prefix) + '-*-*.png')
+
+  for oldFile in glob.glob(pattern):
+    # the id itself may contain dashes, so check the whole name matches
+    if oldFile != thumbnailFile and os.path.basename(oldFile).rsplit('-', 2)[0] == prefix:
+      try:
+        os.remove(oldFile)
+      except OSError:
+        pass